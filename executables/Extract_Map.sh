@@ -0,0 +1,49 @@
+#!/bin/sh
+# Extract_Map
+
+current=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && cd .. && pwd )
+
+#Accept Arguments
+while [[ "$#" > 1 ]]; do case $1 in
+    --config) CONFIG_FILE="$2";;
+    --shard) shard_file="$2";;
+    *);;
+  esac; shift
+done
+
+if [[ x${CONFIG_FILE} == x ]] ; then
+  echo "CONFIG_FILE is not defined!"
+  exit 0
+fi
+
+source ${CONFIG_FILE}
+
+if [[ x${ANALYSIS_DIR} == x ]] ; then
+  echo "ANALYSIS_DIR is not defined!"
+  exit 1
+fi
+
+if [[ x${CODE_DIR} == x ]] ; then
+  echo "CODE_DIR is not defined!"
+  exit 1
+fi
+
+if [[ x${shard_file} == x ]] ; then
+  echo "No shard specified!"
+  exit 1
+fi
+
+shard_name=$( basename ${shard_file} .txt )
+
+if [ $HOSTNAME != $DESIRED_HOSTNAME ] ; then
+  echo "ERROR: NOT ON CORRECT HOST FOR RUNNING FREESURFER"
+  echo "ABORTING PROCESS"
+  exit 1
+fi
+
+# Subjects with missing stats files are kept in the partial and reported by the reduce job.
+if ${current}/setupfreesurfer.py extract --code_dir ${CODE_DIR} --subjectlist ${shard_file} --partial ${ANALYSIS_DIR}/extracted/shards/${shard_name}.json ; then
+  exit 0
+else
+  exit 1
+fi
@@ -0,0 +1,39 @@
+#!/bin/sh
+# Extract_Reduce
+
+current=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && cd .. && pwd )
+
+#Accept Arguments
+while [[ "$#" > 1 ]]; do case $1 in
+    --config) CONFIG_FILE="$2";;
+    *);;
+  esac; shift
+done
+
+if [[ x${CONFIG_FILE} == x ]] ; then
+  echo "CONFIG_FILE is not defined!"
+  exit 0
+fi
+
+source ${CONFIG_FILE}
+
+if [[ x${MONITOR_DIR} == x ]] ; then
+  echo "MONITOR_DIR is not defined!"
+  exit 1
+fi
+
+if [[ x${CODE_DIR} == x ]] ; then
+  echo "CODE_DIR is not defined!"
+  exit 1
+fi
+
+${current}/palantir/palantir cell ${MONITOR_DIR} -r Project -c Extract_Sharded --settext "Running" --setanimate "bars" --setbgcolor "#efd252" --settxtcolor "#ec6527" --addnote "Merging shards"
+
+if ${current}/setupfreesurfer.py merge --code_dir ${CODE_DIR} ; then
+  ${current}/palantir/palantir cell ${MONITOR_DIR} -r Project -c Extract_Sharded --settext "Finished" --setanimate "none" --setbgcolor "#009933" --settxtcolor "#004c19" --addnote "Successfully finished"
+else
+  ${current}/palantir/palantir cell ${MONITOR_DIR} -r Project -c Extract_Sharded --settext "Error" --setanimate "toggle" --setbgcolor "#cb3448" --settxtcolor "#791f2b" --addnote "Error"
+  exit 1
+fi
+
+exit 0
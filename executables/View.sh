@@ -45,7 +45,15 @@ fi
 export FREESURFER_HOME=$FREESURFER_HOME
 export SUBJECTS_DIR=$SUBJECTS_DIR
 
-source ${FREESURFER_HOME}/SetUpFreeSurfer.sh
+# The node-local copy of FreeSurfer, if the project caches one; the shared install if that fails.
+export FREESURFER_HOME=$( ${current}/setupfreesurfer.py freesurfer_home --code_dir ${CODE_DIR} || echo ${FREESURFER_HOME} )
+
+#Load the environment captured at setup, falling back to sourcing FreeSurfer
+if [[ -e ${FREESURFER_ENV} ]] ; then
+  source ${FREESURFER_ENV}
+else
+  source ${FREESURFER_HOME}/SetUpFreeSurfer.sh
+fi
 
 if [[ ${IS_LONGITUDINAL} == "True" ]] ; then
   case $phase in
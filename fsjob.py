@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+import sys
+import os
+from docopt.docopt import docopt
+from fstools import job
+from setupfreesurfer import Project, clean_path
+
+Version = "0.2"
+doc = """
+FreeSurfer job runner.
+
+Runs one recon-all stage of the Project.scripts stage table as a Condor job, reporting to the dashboard
+in-process. Submitted by the stage scripts setupfreesurfer generates.
+
+Usage:
+  fsjob <stage> --config <file> --subject <id> [--timepoint <tp>]... [--inputfile <file>]...
+
+Options:
+  -h --help                             Show this screen.
+  -v --version                          Show the current version.
+  --config <file>                       The project's scripts/config.sh.
+  --subject <id>                        Subject to process.
+  --timepoint <tp>                      Timepoint (longitudinal projects). Base stages take every timepoint.
+  --inputfile <file>                    Input image. (Cross_Initialize)
+"""
+
+if __name__ == '__main__':
+    args = docopt(doc, version='FreeSurfer job runner v{0}'.format(Version))
+    config = job.read_exports(clean_path(args["--config"]), os.environ)
+    project = Project.load(config["CODE_DIR"])
+    if args["<stage>"] not in project.stages():
+        print("Unknown stage '{0}'. Stages: {1}".format(args["<stage>"], ", ".join(sorted(project.stages()))))
+        sys.exit(1)
+    sys.exit(job.run(project, config, args["<stage>"], args["--subject"], timepoints=args["--timepoint"], inputs=[clean_path(path) for path in args["--inputfile"]]))
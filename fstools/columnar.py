@@ -0,0 +1,115 @@
+import os
+from fstools import util
+from fstools import stats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# Directory of the per-table .npy matrices, under each extraction's output directory.
+MATRIX_DIR = "matrices"
+LONG_COLUMNS = ["subject", "table", "hemisphere", "parcellation", "measure", "region", "value"]
+
+def describe_table(name):
+    """(hemisphere, parcellation, measure) of a table name such as 'lh_aparc-destrieux-thickness'."""
+    if name == "aseg-volume":
+        return None, "aseg", "volume"
+    hemi, rest = name.split("_", 1)
+    label, measure = rest[len("aparc-"):].rsplit("-", 1)
+    return hemi, label, measure
+
+def region_of(column, hemisphere, measure):
+    """Region name of a table column: 'lh_bankssts_thickness' -> 'bankssts', 'lh_MeanThickness_thickness' -> 'MeanThickness'."""
+    suffix = "_" + measure
+    if column.endswith(suffix):
+        column = column[:-len(suffix)]
+    if hemisphere != None and column.startswith(hemisphere + "_"):
+        column = column[len(hemisphere) + 1:]
+    return column
+
+def long_rows(records):
+    """
+    One (subject, table, hemisphere, parcellation, measure, region, value) row per extracted value.
+    The whole-brain measures repeated in every aparc table are only given once, from aseg.
+    """
+    for record in records:
+        for name in sorted(record["tables"]):
+            hemisphere, parcellation, measure = describe_table(name)
+            for column, value in record["tables"][name]:
+                if hemisphere != None and column in stats.GLOBAL_MEASURES:
+                    continue
+                region = region_of(column, hemisphere, measure)
+                hemi = hemisphere
+                if hemi == None:
+                    hemi = "lh" if region.startswith("Left-") else "rh" if region.startswith("Right-") else ""
+                yield (record["id"], name, hemi, parcellation, measure, region, value)
+
+def matrix(records, name):
+    """(columns, subjects x columns float64 array) for one table; missing values are NaN."""
+    columns = []
+    seen = set()
+    for record in records:
+        for column, value in record["tables"].get(name, []):
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+    index = dict((column, position) for position, column in enumerate(columns))
+    values = numpy.full((len(records), len(columns)), numpy.nan)
+    for row, record in enumerate(records):
+        for column, value in record["tables"].get(name, []):
+            if value != None:
+                values[row, index[column]] = value
+    return columns, values
+
+def save_array(path, array):
+    """Save one .npy through a temporary file and rename, so a reader that has the old one mapped keeps a whole file."""
+    temp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp, "wb") as array_file:
+        numpy.save(array_file, array)
+    os.rename(temp, path)
+
+def write_matrices(records, matrix_dir):
+    """
+    Write every table as a subjects x columns matrix into matrix_dir, one .npy per table so each can be
+    loaded with mmap_mode="r": 'subjects.npy', then '<table>.npy' and '<table>.columns.npy' for each table.
+    """
+    util.makedirs(matrix_dir)
+    save_array(os.path.join(matrix_dir, "subjects.npy"), numpy.array([record["id"] for record in records]))
+    for name in stats.table_names():
+        columns, values = matrix(records, name)
+        save_array(os.path.join(matrix_dir, name + ".npy"), values)
+        save_array(os.path.join(matrix_dir, name + ".columns.npy"), numpy.array(columns))
+    return matrix_dir
+
+def write_dataset(records, path_stem):
+    """
+    Write the long-format dataset as Parquet, or Feather if no Parquet engine is installed.
+    Returns the path written, or None if neither could be written.
+    """
+    frame = pandas.DataFrame(list(long_rows(records)), columns=LONG_COLUMNS)
+    for column in LONG_COLUMNS[:-1]:
+        frame[column] = frame[column].astype("category")
+    frame["value"] = frame["value"].astype("float64")
+    for extension, writer in [(".parquet", frame.to_parquet), (".feather", frame.to_feather)]:
+        try:
+            writer(path_stem + extension)
+            return path_stem + extension
+        except ImportError:
+            continue
+    return None
+
+def write_all(records, out_dir):
+    """Write the columnar outputs the installed libraries allow. Returns the paths written."""
+    written = []
+    if numpy != None:
+        written.append(write_matrices(records, os.path.join(out_dir, MATRIX_DIR)))
+    if pandas != None:
+        dataset = write_dataset(records, os.path.join(out_dir, "stats"))
+        if dataset != None:
+            written.append(dataset)
+    return written
@@ -0,0 +1,57 @@
+import os
+from palantir import palantir
+
+# Cell styles used throughout the stage scripts.
+STYLES = {
+    "Running": {"background_color":"#efd252", "text_color":"#ec6527", "animation":"bars"},
+    "Finished": {"background_color":"#009933", "text_color":"#004c19", "animation":"none"},
+    "Error": {"background_color":"#cb3448", "text_color":"#791f2b", "animation":"toggle"},
+    "N/A": {"background_color":"#d2d2d2", "text_color":"#f0f0f0", "animation":"none"},
+    "Incomplete": {"background_color":"#F0F0F0", "text_color":"#969696", "animation":"none"},
+    "Stale": {"background_color":"#f3a35c", "text_color":"#7a3f0c", "animation":"none"},
+}
+
+def status_column(phase, is_longitudinal):
+    if is_longitudinal:
+        return phase.capitalize() + "_Status"
+    return "Status"
+
+def phase_of(fs_id):
+    if ".long." in fs_id:
+        return "long"
+    elif fs_id.endswith("_base"):
+        return "base"
+    return "cross"
+
+def locate(fs_id, rows):
+    """
+    Map a SUBJECTS_DIR entry to the dashboard rows it belongs to.
+    Cross and long directories belong to one <subject>_<timepoint> row; a base belongs to all of its subject's rows.
+    """
+    phase = phase_of(fs_id)
+    if phase == "long":
+        candidates = [fs_id.split(".long.")[0]]
+    elif phase == "base":
+        prefix = fs_id[:-len("_base")] + "_"
+        candidates = [row for row in rows if row.startswith(prefix) and "_" not in row[len(prefix):]]
+    else:
+        candidates = [fs_id]
+    return phase, [row for row in candidates if row in rows]
+
+def state_update(row_id, column_id, state, text=None, note=None):
+    """Build a palantir.cells update styled for one of the STYLES states."""
+    update = {"row_id":row_id, "column_id":column_id, "text":str(text if text != None else state)}
+    update.update(STYLES.get(state, {}))
+    if note != None:
+        update["add_note"] = str(note)
+    return update
+
+def rows(monitor_dir):
+    structure = palantir.read_json(os.path.join(monitor_dir, "data", "structure.json"))
+    return [row["id"] for row in structure["rows"]]
+
+def push(monitor_dir, updates):
+    """Write a batch of cell updates in-process. Returns the number of cells changed."""
+    if not updates:
+        return 0
+    return palantir.cells(monitor_dir, updates)
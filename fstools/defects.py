@@ -0,0 +1,79 @@
+import os
+import re
+import csv
+from fstools import util
+from fstools import statuslog
+from fstools import dashboard
+
+# recon-all.log lines reporting the topology of the surfaces before defect correction.
+EULER = re.compile(r"orig\.nofix lheno\s*=\s*(-?\d+),\s*rheno\s*=\s*(-?\d+)")
+HOLES = re.compile(r"orig\.nofix lhholes\s*=\s*(\d+),\s*rhholes\s*=\s*(\d+)")
+# Older logs only report it from mris_fix_topology, once per hemisphere.
+FIX_TOPOLOGY = re.compile(r"^mris_fix_topology\b.*\s([lr]h)\s*$")
+BEFORE_FIX = re.compile(r"before topology correction, eno=\s*(-?\d+)")
+FIELDS = ["lh_euler", "rh_euler", "lh_holes", "rh_holes"]
+# Subjects whose mean Euler number across hemispheres is below this are likely to need edits (Rosen et al., 2018).
+EULER_THRESHOLD = -217
+
+def harvest(item):
+    """Read the part of a subject's recon-all.log written since the last pass. Returns (fs_id, updated state)."""
+    subjects_dir, fs_id, state = item
+    path = os.path.join(subjects_dir, fs_id, "scripts", "recon-all.log")
+    state = dict(state)
+    if os.path.exists(path) and os.path.getsize(path) < state.get("offset", 0):
+        state = {}
+    lines, state["offset"] = statuslog.tail(path, state.get("offset", 0))
+    for line in lines:
+        match = EULER.search(line)
+        if match:
+            state["lh_euler"], state["rh_euler"] = int(match.group(1)), int(match.group(2))
+            continue
+        match = HOLES.search(line)
+        if match:
+            state["lh_holes"], state["rh_holes"] = int(match.group(1)), int(match.group(2))
+            continue
+        match = FIX_TOPOLOGY.search(line)
+        if match:
+            state["hemi"] = match.group(1)
+            continue
+        match = BEFORE_FIX.search(line)
+        if match and state.get("hemi"):
+            state[state["hemi"] + "_euler"] = int(match.group(1))
+            state[state["hemi"] + "_holes"] = (2 - int(match.group(1))) // 2
+    return fs_id, state
+
+def update(subjects_dir, fs_ids, cache_loc, workers=8):
+    """Harvest the logs of fs_ids in a thread pool, resuming each from its byte offset. Returns {fs_id: state}."""
+    states = util.read_json(cache_loc, {})
+    results = util.pool_map(harvest, [(subjects_dir, fs_id, states.get(fs_id, {})) for fs_id in sorted(fs_ids)], workers=workers)
+    states.update(results)
+    util.write_json(cache_loc, states)
+    return states
+
+def complete(state):
+    return all(state.get(field) != None for field in ["lh_euler", "rh_euler"])
+
+def write_table(path, states):
+    util.makedirs(os.path.dirname(path))
+    with open(path, "w") as table_file:
+        writer = csv.writer(table_file, lineterminator="\n")
+        writer.writerow(["id"] + FIELDS)
+        for fs_id in sorted(states):
+            if complete(states[fs_id]):
+                writer.writerow([fs_id] + [states[fs_id].get(field, "") for field in FIELDS])
+
+def updates(states, rows, column="Euler"):
+    """
+    Cell updates for every subject with defect counts. The text leads with the zero-padded number of holes,
+    so sorting the column by text ranks subjects by their defects.
+    """
+    cells = []
+    for fs_id in sorted(states):
+        state = states[fs_id]
+        if fs_id not in rows or not complete(state):
+            continue
+        holes = (2 - state["lh_euler"]) // 2 + (2 - state["rh_euler"]) // 2
+        text = "{0:04d} holes (Euler lh {1}, rh {2})".format(holes, state["lh_euler"], state["rh_euler"])
+        flagged = (state["lh_euler"] + state["rh_euler"]) / 2.0 < EULER_THRESHOLD
+        cells.append(dashboard.state_update(fs_id, column, "Error" if flagged else "Finished", text=text))
+    return cells
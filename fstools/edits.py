@@ -0,0 +1,78 @@
+import os
+import hashlib
+from fstools import util
+
+# Files a user edits by hand, with the rerun stage each needs, most invasive first:
+# a run from an earlier entry point also picks up every edit after it.
+EDITS = [
+    ("transforms/talairach.xfm", "talRerun"),
+    ("mri/brainmask.mgz", "maskRerun"),
+    ("tmp/control.dat", "cpRerun"),
+    ("mri/wm.mgz", "wmRerun"),
+    ("mri/brain.finalsurfs.manedit.mgz", "gmRerun"),
+]
+# Per-subject record of the editable files as the last successful run left them.
+SNAPSHOT = "fsjob.edits.json"
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_state(path, previous=None):
+    """[size, mtime, sha1] of path, or None if it does not exist. The sha1 is reused if size and mtime match previous."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    if previous != None and previous[0] == info.st_size and previous[1] == info.st_mtime:
+        return [info.st_size, info.st_mtime, previous[2]]
+    return [info.st_size, info.st_mtime, file_sha1(path)]
+
+def snapshot_loc(subject_path):
+    return os.path.join(subject_path, "scripts", SNAPSHOT)
+
+def snapshot(subject_path):
+    """Record the editable files of subject_path, after a run has finished writing them."""
+    if not os.path.isdir(os.path.join(subject_path, "scripts")):
+        return None
+    previous = util.read_json(snapshot_loc(subject_path), {})
+    states = dict((relative, file_state(os.path.join(subject_path, relative), previous.get(relative))) for relative, stage in EDITS)
+    util.write_json(snapshot_loc(subject_path), states)
+    return states
+
+def changed(subject_path):
+    """
+    The editable files changed since the last run, in EDITS order. Compared against the snapshot by
+    content; subjects run before snapshots were kept fall back to files newer than recon-all.done.
+    """
+    previous = util.read_json(snapshot_loc(subject_path))
+    if previous == None:
+        done_loc = os.path.join(subject_path, "scripts", "recon-all.done")
+        if not os.path.exists(done_loc):
+            return []
+        finished = os.path.getmtime(done_loc)
+        return [relative for relative, stage in EDITS
+                if os.path.exists(os.path.join(subject_path, relative)) and os.path.getmtime(os.path.join(subject_path, relative)) > finished]
+    result = []
+    for relative, stage in EDITS:
+        state = file_state(os.path.join(subject_path, relative), previous.get(relative))
+        old = previous.get(relative)
+        if (state == None) != (old == None) or (state != None and state[2] != old[2]):
+            result.append(relative)
+    return result
+
+def plan(subject_path):
+    """(rerun stage, changed files) for subject_path: the cheapest rerun that includes every edit, or (None, [])."""
+    files = changed(subject_path)
+    for relative, stage in EDITS:
+        if relative in files:
+            return stage, files
+    return None, []
+
+def plan_all(subjects_dir, fs_ids, workers=8):
+    """plan() of every subject in fs_ids, in parallel, as {fs_id: (rerun stage, changed files)}."""
+    fs_ids = list(fs_ids)
+    return dict(zip(fs_ids, util.pool_map(lambda fs_id: plan(os.path.join(subjects_dir, fs_id)), fs_ids, workers=workers)))
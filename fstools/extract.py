@@ -0,0 +1,149 @@
+import os
+import csv
+import hashlib
+from fstools import util
+from fstools import stats
+from fstools import columnar
+
+def read_subject_list(path):
+    with open(path, "r") as list_file:
+        return list_file.read().split()
+
+def format_value(value):
+    return "" if value == None else repr(value)
+
+def file_key(path, use_hash=False):
+    """Identify a stats file by path, size and mtime, plus a sha1 of its contents if use_hash."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return [path, None, None, None]
+    digest = None
+    if use_hash:
+        with open(path, "rb") as stats_file:
+            digest = hashlib.sha1(stats_file.read()).hexdigest()
+    return [path, info.st_size, info.st_mtime, digest]
+
+def same_key(cached, current, use_hash):
+    if cached == None or len(cached) != len(current):
+        return False
+    for old, new in zip(cached, current):
+        if list(old[:3]) != list(new[:3]) or (use_hash and old[3] != new[3]):
+            return False
+    return True
+
+def parse_cached(item):
+    """
+    Parse one subject, or reuse its cached record if none of its stats files changed.
+    The cache is one json file per subject, so workers never write the same file.
+    """
+    subjects_dir, fs_id, cache_dir, use_hash = item
+    key = [file_key(path, use_hash) for path, parser in stats.stats_files(subjects_dir, fs_id)]
+    cache_loc = os.path.join(cache_dir, fs_id + ".json")
+    cached = util.read_json(cache_loc)
+    if cached != None and cached.get("version") == stats.RECORD_VERSION and same_key(cached["key"], key, use_hash):
+        record = cached["record"]
+        record["reparsed"] = False
+        return record
+    record = stats.parse_subject((subjects_dir, fs_id))
+    util.write_json(cache_loc, {"version":stats.RECORD_VERSION, "key":key, "record":record})
+    record["reparsed"] = True
+    return record
+
+def parse(subjects_dir, fs_ids, workers=8, cache_dir=None, use_hash=False):
+    """
+    Parse every subject's stats files across a process pool. Returns the records in fs_ids order.
+    With a cache_dir, only subjects whose stats files changed since the last run are parsed again.
+    """
+    if cache_dir == None:
+        return util.pool_map(stats.parse_subject, [(subjects_dir, fs_id) for fs_id in fs_ids], workers=workers, processes=True)
+    util.makedirs(cache_dir)
+    return util.pool_map(parse_cached, [(subjects_dir, fs_id, cache_dir, use_hash) for fs_id in fs_ids], workers=workers, processes=True)
+
+def write_table(path, name, records, stacked=False, header=None):
+    """
+    Write one table in the aparcstats2table/asegstats2table csv layout: a row per subject, a column per measure.
+    stacked tables (longitudinal) also carry subject and timepoint columns after the id.
+    header overrides the first header cell for tables the stats tools do not produce.
+    """
+    columns = []
+    seen = set()
+    for record in records:
+        for column, value in record["tables"].get(name, []):
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+    with open(path, "w") as table_file:
+        writer = csv.writer(table_file, lineterminator="\n")
+        writer.writerow([header or stats.table_header(name)] + (["subject", "timepoint"] if stacked else []) + columns)
+        for record in records:
+            values = dict(record["tables"].get(name, []))
+            keys = [record["subject"], record["timepoint"]] if stacked else []
+            writer.writerow([record["id"]] + keys + [format_value(values.get(column)) for column in columns])
+
+def write_tables(records, out_dir, prefix="", stacked=False):
+    util.makedirs(out_dir)
+    paths = []
+    for name in stats.table_names():
+        path = os.path.join(out_dir, "{0}{1}-table.csv".format(prefix, name))
+        write_table(path, name, records, stacked=stacked)
+        paths.append(path)
+    return paths
+
+def extract(subjects_dir, out_dir, fs_ids, workers=8, cache_dir=None, use_hash=False):
+    """
+    Extract every stats table for fs_ids into out_dir, reading each stats file once,
+    as csv tables plus the columnar outputs (matrices/, stats.parquet) the installed libraries allow.
+    Returns the parsed records; subjects with missing stats files list them under "missing".
+    """
+    records = parse(subjects_dir, fs_ids, workers=workers, cache_dir=cache_dir, use_hash=use_hash)
+    write_tables(records, out_dir)
+    columnar.write_all(records, out_dir)
+    return records
+
+def long_id(subject, timepoint):
+    return "{0}_{1}.long.{0}_base".format(subject, timepoint)
+
+def split_long_id(fs_id):
+    """(subject, timepoint) of a '<subject>_<timepoint>.long.<subject>_base' directory name."""
+    cross, base = fs_id.split(".long.", 1)
+    subject = base[:-len("_base")]
+    return subject, cross[len(subject) + 1:]
+
+def extract_longitudinal(subjects_dir, out_dir, sessions, workers=8, cache_dir=None, use_hash=False):
+    """
+    Extract the .long. directories of every (subject, timepoint) session in one parallel pass.
+    Writes a table set per timepoint to out_dir/tp_<timepoint>/, and stacked tables with
+    subject and timepoint columns (plus their columnar outputs) to out_dir.
+    """
+    sessions = sorted(sessions)
+    records = parse(subjects_dir, [long_id(subject, timepoint) for subject, timepoint in sessions], workers=workers, cache_dir=cache_dir, use_hash=use_hash)
+    for record, (subject, timepoint) in zip(records, sessions):
+        record["subject"] = subject
+        record["timepoint"] = timepoint
+    for timepoint in sorted(set(timepoint for subject, timepoint in sessions)):
+        write_tables([record for record in records if record["timepoint"] == timepoint], os.path.join(out_dir, "tp_{0}".format(timepoint)))
+    write_tables(records, out_dir, stacked=True)
+    columnar.write_all(records, out_dir)
+    return records
+
+def write_partial(records, path):
+    """Write one shard's parsed records, to be combined by merge."""
+    util.write_json(path, records)
+
+def merge(partial_paths, out_dir):
+    """
+    Combine the partial records of every shard, in order, and write the tables.
+    Returns (records, partial paths that were missing).
+    """
+    records = []
+    missing = []
+    for path in partial_paths:
+        partial = util.read_json(path)
+        if partial == None:
+            missing.append(path)
+        else:
+            records.extend(partial)
+    write_tables(records, out_dir)
+    columnar.write_all(records, out_dir)
+    return records, missing
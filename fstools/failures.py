@@ -0,0 +1,106 @@
+import os
+import re
+import time
+import signal
+from fstools import util
+from fstools import statuslog
+
+# Signatures of failures that a resubmission can fix; anything else is a pipeline error.
+MEMORY = re.compile(r"std::bad_alloc|Cannot allocate memory|[Oo]ut of [Mm]emory|MemoryError|could not allocate|^Killed")
+TRANSIENT = re.compile(r"Stale (NFS )?file handle|Input/output error|Resource temporarily unavailable|"
+                       r"Transport endpoint is not connected|No space left on device|Connection timed out|Network is unreachable")
+# How much of the end of each log is searched.
+TAIL_BYTES = 1 << 16
+# Seconds before the first retry; each further retry waits twice as long.
+BACKOFF_SECONDS = 600
+# Memory requests grow by this factor after running out of memory, up to MAX_MEMORY MB.
+MEMORY_FACTOR = 2
+MAX_MEMORY = 32768
+
+def size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def read_since(path, offset=0):
+    """The last lines written to path since byte offset (from the start if it was replaced), at most TAIL_BYTES."""
+    end = size(path)
+    start = offset if end >= offset else 0
+    return statuslog.tail(path, max(start, end - TAIL_BYTES))[0]
+
+def job_ad(environ):
+    """The attributes of the running Condor job ad, from $_CONDOR_JOB_AD, or {} outside Condor."""
+    attributes = {}
+    try:
+        with open(environ["_CONDOR_JOB_AD"], "r") as ad_file:
+            for line in ad_file:
+                if " = " in line:
+                    name, value = line.strip().split(" = ", 1)
+                    attributes[name] = value.strip('"')
+    except (KeyError, IOError):
+        pass
+    return attributes
+
+def classify(returncode, lines):
+    """
+    ("memory" | "transient" | "error", reason) of a failed run, from its exit code and the lines of its
+    logs (recon-all.log, the job's _err.txt). Killed by SIGKILL is taken to be the out-of-memory killer.
+    """
+    for line in reversed(lines):
+        if MEMORY.search(line):
+            return "memory", line.strip()
+        if TRANSIENT.search(line):
+            return "transient", line.strip()
+    if returncode in [-signal.SIGKILL, 128 + signal.SIGKILL]:
+        return "memory", "Killed (signal {0})".format(signal.SIGKILL)
+    for line in reversed(lines):
+        if "ERROR" in line:
+            return "error", line.strip()
+    return "error", "exit code {0}".format(returncode)
+
+def failure_loc(failure_dir, target):
+    return os.path.join(failure_dir, target + ".json")
+
+def record(failure_dir, target, stage, arguments, kind, reason, memory, retries):
+    """
+    Record a failed job of stage on target. Failures of jobs resubmitted by retry count as further attempts.
+    Returns the record; its "retry" is False once the failure needs review (a pipeline error, or no retries left).
+    """
+    previous = util.read_json(failure_loc(failure_dir, target)) or {}
+    attempts = previous.get("attempts", 0) + 1 if previous.get("resubmitted") else 1
+    failure = {"stage":stage, "arguments":arguments, "kind":kind, "reason":reason, "memory":memory,
+               "attempts":attempts, "failed":time.time(), "retry":kind != "error" and attempts <= retries}
+    util.write_json(failure_loc(failure_dir, target), failure)
+    return failure
+
+def clear(failure_dir, target):
+    if os.path.exists(failure_loc(failure_dir, target)):
+        os.unlink(failure_loc(failure_dir, target))
+
+def next_memory(failure):
+    """Memory to request for the retry: more after running out of memory, the same otherwise."""
+    if failure["kind"] == "memory":
+        return min(int(failure["memory"]) * MEMORY_FACTOR, MAX_MEMORY)
+    return int(failure["memory"])
+
+def due(failure, now=None):
+    """True if failure is to be retried and its backoff has passed."""
+    if not failure.get("retry") or failure.get("resubmitted"):
+        return False
+    return (now or time.time()) - failure["failed"] >= BACKOFF_SECONDS * 2 ** (failure["attempts"] - 1)
+
+def load(failure_dir):
+    """{target: failure} of every recorded failure."""
+    failures = {}
+    if os.path.isdir(failure_dir):
+        for entry in util.list_dir(failure_dir):
+            if entry.name.endswith(".json"):
+                failure = util.read_json(entry.path)
+                if failure != None:
+                    failures[entry.name[:-len(".json")]] = failure
+    return failures
+
+def mark_resubmitted(failure_dir, target, failure):
+    failure["resubmitted"] = time.time()
+    util.write_json(failure_loc(failure_dir, target), failure)
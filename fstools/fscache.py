@@ -0,0 +1,97 @@
+import os
+import sys
+import fcntl
+import shutil
+import hashlib
+from fstools import util
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest(freesurfer_home, cache_loc, workers=8):
+    """
+    md5sum-format manifest ("<md5>  ./<path>") of every regular file under freesurfer_home, used by the
+    jobs to validate their node-local copy. Checksums are cached in cache_loc by size and mtime, so only
+    new or changed files are hashed again when setup is rerun.
+    """
+    cache = util.read_json(cache_loc, {})
+    files = []
+    for directory, dirnames, filenames in os.walk(freesurfer_home):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(directory, name)
+            if not os.path.islink(path):
+                info = os.stat(path)
+                files.append((os.path.relpath(path, freesurfer_home), info.st_size, info.st_mtime))
+
+    def checksum(item):
+        relative, size, mtime = item
+        cached = cache.get(relative)
+        if cached != None and cached[0] == size and cached[1] == mtime:
+            return cached[2]
+        return file_md5(os.path.join(freesurfer_home, relative))
+
+    digests = util.pool_map(checksum, files, workers=workers)
+    util.write_json(cache_loc, dict((relative, [size, mtime, digest]) for (relative, size, mtime), digest in zip(files, digests)))
+    return "".join("{0}  ./{1}\n".format(digest, relative) for (relative, size, mtime), digest in zip(files, digests))
+
+def version(freesurfer_home, manifest_text):
+    """Name of a cached install: FreeSurfer's build stamp plus a digest of the manifest, so any change to the install gets a new cache."""
+    stamp = "freesurfer"
+    try:
+        with open(os.path.join(freesurfer_home, "build-stamp.txt"), "r") as stamp_file:
+            stamp = "".join(character for character in stamp_file.read().strip() if character.isalnum() or character in "-_.") or stamp
+    except IOError:
+        pass
+    return "{0}-{1}".format(stamp, hashlib.md5(manifest_text.encode("utf-8")).hexdigest()[:8])
+
+def validate(directory, manifest_loc, workers=8):
+    """True if every file in the manifest is present in directory with its recorded checksum."""
+    entries = []
+    with open(manifest_loc, "r") as manifest_file:
+        for line in manifest_file:
+            digest, relative = line.rstrip("\n").split("  ", 1)
+            entries.append((digest, os.path.join(directory, relative)))
+
+    def matches(entry):
+        try:
+            return file_md5(entry[1]) == entry[0]
+        except (IOError, OSError):
+            return False
+
+    return all(util.pool_map(matches, entries, workers=workers))
+
+def use_local(freesurfer_home, cache_root, version_name, manifest_loc):
+    """
+    Path of the node-local copy of freesurfer_home, populating and validating it first if needed.
+    Jobs on the same node serialize on a lock file, so only the first one copies. Falls back to
+    freesurfer_home if the copy could not be made. Progress goes to stderr, so stdout is only the path.
+    """
+    local_home = os.path.join(cache_root, version_name)
+    complete = os.path.join(local_home, ".complete")
+    if os.path.exists(complete):
+        return local_home
+    try:
+        util.makedirs(cache_root)
+        with open(os.path.join(cache_root, "." + version_name + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(complete):
+                partial = local_home + ".partial"
+                for stale in [local_home, partial]:
+                    if os.path.exists(stale):
+                        shutil.rmtree(stale)
+                sys.stderr.write("Caching {0} in {1}\n".format(freesurfer_home, local_home))
+                shutil.copytree(freesurfer_home, partial, symlinks=True)
+                if not validate(partial, manifest_loc):
+                    shutil.rmtree(partial)
+                    raise IOError("Cached copy of {0} does not match {1}".format(freesurfer_home, manifest_loc))
+                os.rename(partial, local_home)
+                open(complete, "w").close()
+    except EnvironmentError as error:
+        sys.stderr.write("WARNING: COULD NOT CACHE FREESURFER_HOME, RUNNING FROM {0} ({1})\n".format(freesurfer_home, error))
+        return freesurfer_home
+    return local_home
@@ -0,0 +1,319 @@
+import os
+import re
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import contextlib
+import subprocess
+from palantir import palantir
+from fstools import dashboard
+from fstools import fscache
+from fstools import resume
+from fstools import edits
+from fstools import provenance
+from fstools import results
+from fstools import locks
+from fstools import failures
+
+EXPORT = re.compile(r"^export\s+(\w+)=(.*)$")
+VARIABLE = re.compile(r"\$\{(\w+)\}|\$(\w+)")
+
+def expand(value, environ):
+    """Evaluate a shell assignment value: optional double quotes, backslash escapes and $NAME or ${NAME} references."""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    result = []
+    position = 0
+    while position < len(value):
+        character = value[position]
+        if character == "\\" and position + 1 < len(value):
+            result.append(value[position + 1])
+            position += 2
+            continue
+        match = VARIABLE.match(value, position) if character == "$" else None
+        if match:
+            result.append(environ.get(match.group(1) or match.group(2), ""))
+            position = match.end()
+            continue
+        result.append(character)
+        position += 1
+    return "".join(result)
+
+def read_exports(path, environ):
+    """Apply the export lines of a generated shell file (config.sh, freesurfer_env.sh) to a copy of environ."""
+    environ = dict(environ)
+    with open(path, "r") as exports_file:
+        for line in exports_file:
+            match = EXPORT.match(line.strip())
+            if match:
+                environ[match.group(1)] = expand(match.group(2), environ)
+    return environ
+
+def source_environment(setup_loc, environ):
+    """Environment after sourcing SetUpFreeSurfer.sh, for projects without a captured environment."""
+    command = ["bash", "-c", "source {0} > /dev/null 2>&1; env -0".format(setup_loc)]
+    output = subprocess.Popen(command, stdout=subprocess.PIPE, env=environ).communicate()[0].decode("utf-8", "replace")
+    return dict(line.split("=", 1) for line in output.split("\0") if "=" in line)
+
+def freesurfer_home(project, config):
+    """FREESURFER_HOME for a job on this node: the node-local copy if the project caches it, else the shared install."""
+    if project.freesurfer_cache != None and config.get("FREESURFER_VERSION"):
+        return fscache.use_local(project.freesurfer_home, project.freesurfer_cache, config["FREESURFER_VERSION"], project.manifest_loc)
+    return project.freesurfer_home
+
+def environment(project, config):
+    """
+    The environment recon-all runs in: FREESURFER_HOME (the node-local copy if the project caches it),
+    plus the environment captured at setup.
+    """
+    environ = dict(os.environ)
+    home = freesurfer_home(project, config)
+    environ["FREESURFER_HOME"] = home
+    environ["SUBJECTS_DIR"] = project.subjects_dir
+    if os.path.exists(project.env_loc):
+        environ = read_exports(project.env_loc, environ)
+    else:
+        environ = source_environment(os.path.join(home, "SetUpFreeSurfer.sh"), environ)
+    environ["SUBJECTS_DIR"] = project.subjects_dir
+    return environ
+
+def duration(seconds):
+    if seconds < 120:
+        return "{0:.1f}s".format(seconds)
+    elif seconds < 7200:
+        return "{0:.1f}m".format(seconds / 60.0)
+    return "{0:.1f}h".format(seconds / 3600.0)
+
+class Timer(object):
+    """Wall-clock time of each phase of a job, in the order they ran."""
+    def __init__(self):
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+            print("fsjob: {0} took {1}".format(name, duration(self.phases[-1][1])))
+
+    def summary(self):
+        return ", ".join("{0} {1}".format(name, duration(seconds)) for name, seconds in self.phases)
+
+def stage_in(subjects_dir, scratch_root, directories):
+    """Copy the directories a run needs from subjects_dir to a new scratch directory, and return it."""
+    if not os.path.isdir(scratch_root):
+        os.makedirs(scratch_root)
+    scratch_dir = tempfile.mkdtemp(prefix="setupfreesurfer.", dir=scratch_root)
+    for name in directories:
+        if os.path.exists(os.path.join(subjects_dir, name)):
+            shutil.copytree(os.path.join(subjects_dir, name), os.path.join(scratch_dir, name), symlinks=True)
+    if os.path.exists(os.path.join(subjects_dir, "fsaverage")):
+        os.symlink(os.path.join(subjects_dir, "fsaverage"), os.path.join(scratch_dir, "fsaverage"))
+    return scratch_dir
+
+def stage_out(scratch_dir, subjects_dir, target):
+    """Copy target back next to the original in subjects_dir, then swap the two with renames."""
+    incoming = os.path.join(subjects_dir, ".{0}.staging.{1}".format(target, os.getpid()))
+    outgoing = os.path.join(subjects_dir, ".{0}.replaced.{1}".format(target, os.getpid()))
+    try:
+        shutil.copytree(os.path.join(scratch_dir, target), incoming, symlinks=True)
+    except EnvironmentError:
+        shutil.rmtree(incoming, ignore_errors=True)
+        raise
+    if os.path.exists(os.path.join(subjects_dir, target)):
+        os.rename(os.path.join(subjects_dir, target), outgoing)
+    os.rename(incoming, os.path.join(subjects_dir, target))
+    shutil.rmtree(outgoing, ignore_errors=True)
+
+def call(command, environ, cwd):
+    """Run command, passing a TERM (e.g. a Condor eviction) on to it before exiting."""
+    process = subprocess.Popen(command, env=environ, cwd=cwd)
+
+    def terminate(signum, frame):
+        process.terminate()
+        process.wait()
+        raise SystemExit(128 + signum)
+
+    previous = signal.signal(signal.SIGTERM, terminate)
+    try:
+        return process.wait()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+def describe(script, subject, timepoints, inputs, is_longitudinal, flags=None):
+    """
+    (directory written, directories read, dashboard rows, recon-all arguments) of a stage for one subject.
+    Base stages take every timepoint of the subject; cross and long stages take one.
+    flags replaces the stage's recon-all flags, e.g. when resuming.
+    """
+    phase = script.name.split("_")[0].lower()
+    flags = script.recon if flags == None else flags
+    if phase == "base":
+        base = subject + "_base"
+        crosses = ["{0}_{1}".format(subject, timepoint) for timepoint in timepoints]
+        arguments = ["-base", base] + [argument for cross in crosses for argument in ["-tp", cross]]
+        return base, crosses, crosses, arguments + flags
+    cross = "{0}_{1}".format(subject, timepoints[0]) if is_longitudinal else subject
+    if phase == "long":
+        base = subject + "_base"
+        target = "{0}.long.{1}".format(cross, base)
+        return target, [cross, base], [cross], ["-long", cross, base] + flags
+    arguments = [argument for path in inputs for argument in ["-i", path]]
+    return cross, [], [cross], arguments + ["-subjid", cross] + flags
+
+def report(monitor_dir, rows, stage, state, text=None, note=None):
+    return dashboard.push(monitor_dir, [dashboard.state_update(row, stage, state, text=text, note=note) for row in rows])
+
+def add_row(monitor_dir, row):
+    """Create the dashboard row of a subject that was not registered with setupfreesurfer register."""
+    if not os.path.exists(os.path.join(monitor_dir, "data", "{0}-Cross_Initialize.json".format(row))):
+        palantir.update(monitor_dir, add_rows=[row])
+        update = dashboard.state_update(row, "Extract", "N/A")
+        update["boolean"] = "False"
+        dashboard.push(monitor_dir, [update])
+
+def run(project, config, stage, subject, timepoints=None, inputs=None):
+    """
+    Run a stage holding the lease on the directory it writes, so no two jobs process a subject at once,
+    and remove its entry from the project's job index when it ends. Returns the exit code for the job.
+    """
+    script = project.stages()[stage]
+    target = describe(script, subject, timepoints or [None], [], project.is_longitudinal)[0]
+    lease = locks.Lease(project.lock_dir, target, stage)
+    if not lease.acquire():
+        holder = lease.holder() or {}
+        print("ERROR: {0} IS ALREADY BEING PROCESSED BY {1} ON {2}".format(target, holder.get("stage"), holder.get("host")))
+        return 1
+    try:
+        returncode = run_stage(project, config, stage, subject, timepoints, inputs)
+    finally:
+        lease.release()
+    # A checkpointed job raises SystemExit above and keeps its entry, since Condor restarts it.
+    locks.release_job(project.lock_dir, target, stage)
+    return returncode
+
+def run_stage(project, config, stage, subject, timepoints=None, inputs=None):
+    """
+    Run one recon-all stage in-process: report to the dashboard, check the host, load the environment,
+    optionally stage to scratch, run recon-all and report the result with the time each phase took.
+    Resume stages, and any stage restarted after it was checkpointed, only run what recon-all has left.
+    Cross_Initialize copies a finished subject computed from identical inputs instead of running recon-all.
+    Returns the exit code for the job.
+    """
+    script = project.stages()[stage]
+    timer = Timer()
+    target, reads, rows, arguments = describe(script, subject, timepoints or [None], inputs or [], project.is_longitudinal)
+    target_path = os.path.join(project.subjects_dir, target)
+    if script.name.endswith("_Resume") or resume.checkpoint_stage(target_path) == stage:
+        flags, step = resume.entry_point(target_path)
+        if flags == []:
+            resume.clear_checkpoint(target_path)
+            failures.clear(project.cache_dir+"failures/", target)
+            report(project.monitor_dir, rows, stage, "Finished", note="Already finished")
+            return 0
+        print("fsjob: resuming {0} from {1} with {2}".format(target, step or "the start", " ".join(flags)))
+        resume.clear_running(target_path)
+        # Inputs are only given again if the failed run never imported them; recon-all refuses -i once it has.
+        resumed_inputs = [] if resume.imported(target_path) else inputs or []
+        target, reads, rows, arguments = describe(script, subject, timepoints or [None], resumed_inputs, project.is_longitudinal, flags=flags)
+    if stage == "Cross_Initialize":
+        add_row(project.monitor_dir, rows[0])
+    host = socket.gethostname()
+    report(project.monitor_dir, rows, stage, "Running", note="Started running on {0}".format(host))
+    if project.requires_host and host != project.host:
+        print("ERROR: NOT ON CORRECT HOST FOR RUNNING FREESURFER")
+        report(project.monitor_dir, rows, stage, "Error", text="Host Error")
+        return 1
+
+    # Inputs already computed under the same FreeSurfer version and flags (e.g. a duplicate upload) are reused.
+    input_key = None
+    if stage == "Cross_Initialize" and inputs and not os.path.exists(target_path):
+        try:
+            input_key = results.key(inputs, results.freesurfer_version(project.freesurfer_home, config), script.recon)
+            source = results.lookup(project.cache_dir+"results/", project.subjects_dir, input_key, target)
+            if source != None:
+                with timer.phase("clone"):
+                    results.clone(project.subjects_dir, source, target)
+                results.record(project.cache_dir+"results/", project.subjects_dir, input_key, inputs, target, index=False)
+                report(project.monitor_dir, rows, stage, "Finished", text="Reused", note="Copied from {0}, computed from the same inputs ({1})".format(source, timer.summary()))
+                return 0
+        except EnvironmentError as error:
+            print("WARNING: COULD NOT REUSE A PREVIOUS RESULT ({0})".format(error))
+
+    scratch_root = config.get("SCRATCH_ROOT")
+    scratch_dir = None
+    returncode = 1
+    # Only what this run adds to recon-all.log is searched for the cause of a failure.
+    log_loc = os.path.join(target_path, "scripts", "recon-all.log")
+    log_offset = failures.size(log_loc)
+    messages = []
+    try:
+        with timer.phase("environment"):
+            environ = environment(project, config)
+        if scratch_root:
+            with timer.phase("stage in"):
+                scratch_dir = stage_in(project.subjects_dir, scratch_root, [target] + reads)
+            environ["SUBJECTS_DIR"] = scratch_dir
+        with timer.phase("recon-all"):
+            returncode = call(["recon-all"] + arguments, environ, environ["SUBJECTS_DIR"])
+        if scratch_dir != None:
+            with timer.phase("stage out"):
+                stage_out(scratch_dir, project.subjects_dir, target)
+    except EnvironmentError as error:
+        print("ERROR: {0}".format(error))
+        messages.append("ERROR: {0}".format(error))
+        returncode = returncode or 1
+    except SystemExit:
+        # Evicted: keep what recon-all finished, so the restarted job resumes instead of starting over.
+        if scratch_dir != None:
+            try:
+                stage_out(scratch_dir, project.subjects_dir, target)
+            except EnvironmentError:
+                pass
+        resume.write_checkpoint(target_path, stage)
+        report(project.monitor_dir, rows, stage, "Incomplete", text="Checkpointed", note="Interrupted, will resume ({0})".format(timer.summary()))
+        raise SystemExit(resume.CHECKPOINT_EXIT_CODE)
+    finally:
+        if scratch_dir != None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if returncode == 0:
+        resume.clear_checkpoint(target_path)
+        failures.clear(project.cache_dir+"failures/", target)
+        edits.snapshot(target_path)
+        provenance.record(project.subjects_dir, target, reads)
+        if input_key != None:
+            results.record(project.cache_dir+"results/", project.subjects_dir, input_key, inputs, target)
+        report(project.monitor_dir, rows, stage, "Finished", note="Successfully finished ({0})".format(timer.summary()))
+        return 0
+    return report_failure(project, script, subject, timepoints, inputs, target, rows, returncode, failures.read_since(log_loc, log_offset) + messages, timer)
+
+def report_failure(project, script, subject, timepoints, inputs, target, rows, returncode, lines, timer):
+    """
+    Classify a failed run from its exit code, log lines and the job's _err.txt, and record it for
+    setupfreesurfer retry. Memory and transient failures with retries left are resubmitted later;
+    pipeline errors are left on the dashboard for review.
+    """
+    ad = failures.job_ad(os.environ)
+    if ad.get("Err"):
+        lines = lines + failures.read_since(os.path.join(ad.get("Iwd", ""), ad["Err"]))
+    try:
+        memory = int(ad.get("RequestMemory", script.memory))
+    except ValueError:
+        memory = script.memory
+    arguments = ["--config", project.config_loc, "--subject", subject]
+    arguments += [argument for timepoint in timepoints or [] if timepoint != None for argument in ["--timepoint", timepoint]]
+    arguments += [argument for path in inputs or [] for argument in ["--inputfile", path]]
+    kind, reason = failures.classify(returncode, lines)
+    failure = failures.record(project.cache_dir+"failures/", target, script.name, arguments, kind, reason, memory, script.retries)
+    if failure["retry"]:
+        report(project.monitor_dir, rows, script.name, "Incomplete", text="Retrying ({0}/{1})".format(failure["attempts"], script.retries),
+               note="Failed ({0}), exit code {1}, will be resubmitted: {2} ({3})".format(kind, returncode, reason, timer.summary()))
+    else:
+        report(project.monitor_dir, rows, script.name, "Error", text="Needs review" if kind == "error" else "Retries exhausted",
+               note="Error, exit code {0}: {1} ({2})".format(returncode, reason, timer.summary()))
+    return 1
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import socket
+import threading
+import subprocess
+from fstools import util
+
+# A lease not renewed for this long belongs to a job that died without releasing it.
+LEASE_SECONDS = 900
+# A job entry without a cluster id is still being submitted for at most this long.
+SUBMIT_GRACE_SECONDS = 300
+
+def create(path, data):
+    """
+    Create path holding data, unless it already exists. Safe over NFS, where O_EXCL is not: the data is
+    written to a unique file which is then hard-linked into place, and the link count says who won.
+    """
+    util.makedirs(os.path.dirname(path))
+    unique = "{0}.{1}.{2}.tmp".format(path, socket.gethostname(), os.getpid())
+    with open(unique, "w") as unique_file:
+        json.dump(data, unique_file, sort_keys=True)
+    try:
+        try:
+            os.link(unique, path)
+        except OSError:
+            pass
+        return os.stat(unique).st_nlink == 2
+    finally:
+        os.unlink(unique)
+
+def read(path):
+    try:
+        with open(path, "r") as lock_file:
+            return json.load(lock_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+def age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+def remove(path, is_stale):
+    """
+    Remove path if is_stale(path). The file is first renamed to a unique name, so of several processes
+    removing the same stale file only one succeeds, and a fresh file renamed by mistake is put back.
+    """
+    moved = "{0}.{1}.{2}.stale".format(path, socket.gethostname(), os.getpid())
+    try:
+        os.rename(path, moved)
+    except OSError:
+        return
+    if is_stale(moved):
+        os.unlink(moved)
+        return
+    try:
+        os.link(moved, path)
+    except OSError:
+        pass
+    os.unlink(moved)
+
+def lease_loc(lock_dir, target):
+    return os.path.join(lock_dir, target + ".lease")
+
+def job_loc(lock_dir, target):
+    return os.path.join(lock_dir, target + ".job")
+
+def lease_expired(path):
+    return age(path) == None or age(path) > LEASE_SECONDS
+
+class Lease(object):
+    """
+    Exclusive lease on one subject directory, held for the whole of a job. A thread renews it while the
+    job runs; a lease that stops being renewed (the node died) can be taken over after LEASE_SECONDS.
+    """
+    def __init__(self, lock_dir, target, stage):
+        self.path = lease_loc(lock_dir, target)
+        self.data = {"stage":stage, "host":socket.gethostname(), "pid":os.getpid()}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def acquire(self):
+        """True if the lease was taken. Otherwise another job holds it; see holder()."""
+        if not create(self.path, self.data):
+            if not lease_expired(self.path):
+                return False
+            remove(self.path, lease_expired)
+            if not create(self.path, self.data):
+                return False
+        self.thread = threading.Thread(target=self.renew)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def renew(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3.0):
+            try:
+                os.utime(self.path, None)
+            except OSError:
+                pass
+
+    def holder(self):
+        return read(self.path)
+
+    def release(self):
+        self.stopped.set()
+        if self.thread != None:
+            self.thread.join()
+        if read(self.path) == self.data:
+            os.unlink(self.path)
+
+def cluster_queued(cluster):
+    """True if the Condor cluster is still in the queue. Assumed True if condor_q cannot answer."""
+    try:
+        process = subprocess.Popen(["condor_q", str(cluster), "-af", "ClusterId"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = process.communicate()[0]
+    except OSError:
+        return True
+    return process.returncode != 0 or bool(output.strip())
+
+def job_active(lock_dir, target, path):
+    """True if the job recorded in path is still queued or running."""
+    entry = read(path)
+    if entry == None:
+        return False
+    if not lease_expired(lease_loc(lock_dir, target)):
+        return True
+    if entry.get("cluster") != None:
+        return cluster_queued(entry["cluster"])
+    return age(path) != None and age(path) < SUBMIT_GRACE_SECONDS
+
+def claim(lock_dir, target, stage):
+    """
+    Record a job of stage for target in the project's job index before it is submitted.
+    Returns (True, None) if claimed, or (False, entry) with the queued or running job it would duplicate.
+    """
+    path = job_loc(lock_dir, target)
+    entry = {"stage":stage, "submitted":time.time(), "host":socket.gethostname()}
+    if create(path, entry):
+        return True, None
+    if job_active(lock_dir, target, path):
+        return False, read(path)
+    remove(path, lambda moved: not job_active(lock_dir, target, moved))
+    if create(path, entry):
+        return True, None
+    return False, read(path)
+
+def set_cluster(lock_dir, target, cluster):
+    """Add the Condor cluster id to target's job entry, once condor_submit has given one."""
+    path = job_loc(lock_dir, target)
+    entry = read(path)
+    if entry != None:
+        entry["cluster"] = cluster
+        temp = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp, "w") as entry_file:
+            json.dump(entry, entry_file, sort_keys=True)
+        os.rename(temp, path)
+
+def release_job(lock_dir, target, stage):
+    """Remove target's job entry if it is for stage: the job finished, failed or was never submitted."""
+    entry = read(job_loc(lock_dir, target))
+    if entry != None and entry.get("stage") == stage:
+        os.unlink(job_loc(lock_dir, target))
@@ -0,0 +1,94 @@
+import os
+from fstools import util
+from fstools import volumes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CURV_MAGIC = b"\xff\xff\xff"
+
+def read_curv(path):
+    """Read a FreeSurfer curv-format overlay (e.g. lh.thickness) as a float32 array, one value per vertex."""
+    with open(path, "rb") as curv_file:
+        raw = curv_file.read()
+    if raw[:3] == CURV_MAGIC:
+        vertices = int(numpy.frombuffer(raw, dtype=">i4", count=1, offset=3)[0])
+        return numpy.frombuffer(raw, dtype=">f4", count=vertices, offset=15).astype(numpy.float32)
+    # Old format: 3 byte vertex and face counts, then values as int16 hundredths.
+    vertices = (ord(raw[0:1]) << 16) + (ord(raw[1:2]) << 8) + ord(raw[2:3])
+    return (numpy.frombuffer(raw, dtype=">i2", count=vertices, offset=6) / 100.0).astype(numpy.float32)
+
+def read_overlay(path):
+    """Read an overlay in curv format, or as .mgh/.mgz (e.g. the -qcache outputs)."""
+    if path.endswith(".mgh") or path.endswith(".mgz"):
+        return volumes.read_mgh(path)[0].astype(numpy.float32)
+    return read_curv(path)
+
+def stack_name(template, hemi):
+    name = os.path.basename(template.format(hemi=hemi))
+    for extension in [".mgh", ".mgz"]:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+def stack_paths(wholebrain_dir, name):
+    base = os.path.join(wholebrain_dir, name)
+    return base + ".f32", base + ".subjects.txt", base + ".json"
+
+def read_index(index_loc):
+    if not os.path.exists(index_loc):
+        return []
+    with open(index_loc, "r") as index_file:
+        return index_file.read().split()
+
+def load(wholebrain_dir, name):
+    """(subject ids, read-only subjects x vertices float32 memmap) of a stack."""
+    data_loc, index_loc, meta_loc = stack_paths(wholebrain_dir, name)
+    subjects = read_index(index_loc)
+    meta = util.read_json(meta_loc)
+    return subjects, numpy.memmap(data_loc, dtype=numpy.float32, mode="r", shape=(len(subjects), meta["vertices"]))
+
+def append(subjects_dir, wholebrain_dir, template, hemi, fs_ids, workers=8):
+    """
+    Append the overlays of fs_ids not yet in the stack, one subject row at a time, to the
+    on-disk float32 matrix <name>.f32 with its subject index <name>.subjects.txt.
+    Subjects already stacked are skipped, so adding subjects never rebuilds the matrix.
+    Returns (name, subjects added, subjects whose overlay was missing or had the wrong vertex count).
+    """
+    name = stack_name(template, hemi)
+    data_loc, index_loc, meta_loc = stack_paths(wholebrain_dir, name)
+    util.makedirs(wholebrain_dir)
+    subjects = read_index(index_loc)
+    meta = util.read_json(meta_loc, {"source":template, "hemi":hemi, "vertices":None})
+    if meta["vertices"] != None and os.path.exists(data_loc):
+        # Rows written after the index was last updated (an interrupted run) are dropped.
+        with open(data_loc, "ab") as data_file:
+            data_file.truncate(len(subjects) * meta["vertices"] * 4)
+    existing = set(subjects)
+    pending = [fs_id for fs_id in fs_ids if fs_id not in existing]
+
+    def read(fs_id):
+        path = os.path.join(subjects_dir, fs_id, template.format(hemi=hemi))
+        try:
+            return fs_id, read_overlay(path)
+        except (IOError, OSError, ValueError):
+            return fs_id, None
+
+    added, failed = [], []
+    with open(data_loc, "ab") as data_file:
+        with open(index_loc, "a") as index_file:
+            for fs_id, values in util.pool_imap(read, pending, workers=workers):
+                if values is None or (meta["vertices"] != None and len(values) != meta["vertices"]):
+                    failed.append(fs_id)
+                    continue
+                if meta["vertices"] == None:
+                    meta["vertices"] = len(values)
+                    util.write_json(meta_loc, meta)
+                data_file.write(values.astype("<f4").tobytes())
+                data_file.flush()
+                index_file.write(fs_id + "\n")
+                index_file.flush()
+                added.append(fs_id)
+    return name, added, failed
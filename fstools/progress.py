@@ -0,0 +1,47 @@
+import time
+from fstools import scan
+from fstools import dashboard
+from fstools import runtimes
+from fstools import provenance
+
+def describe(state, left):
+    if state.get("step") == None:
+        return "Running"
+    text = "Running: {0}".format(state["step"])
+    if state.get("percent") != None:
+        text += " ({0}%)".format(state["percent"])
+    if left != None:
+        text += ", ~{0} left".format(runtimes.hours(left))
+    return text
+
+def cycle(project, workers=8):
+    """
+    One monitor pass: rescan statuses, read the new part of the status log of every running subject
+    (and of those that just stopped), and push all status cells to the dashboard in one batch,
+    with predicted time left per subject and for the cohort, and bases and longs whose inputs were rerun
+    marked Stale. Returns (running, cells updated).
+    """
+    statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+    connection = runtimes.connect(project.cache_dir+"runtimes.db")
+    try:
+        active = set(fs_id for fs_id in statuses if statuses[fs_id] == "Running")
+        active.update(fs_id for fs_id in runtimes.open_subjects(connection) if fs_id in statuses)
+        states = runtimes.update(connection, project.subjects_dir, statuses, active, workers=workers)
+        step_medians = runtimes.medians(connection)
+    finally:
+        connection.close()
+
+    now = time.time()
+    running = [fs_id for fs_id in sorted(active) if statuses[fs_id] == "Running"]
+    lefts = dict((fs_id, runtimes.remaining(states[fs_id], step_medians, now)) for fs_id in running)
+    texts = dict((fs_id, describe(states[fs_id], lefts[fs_id])) for fs_id in running)
+
+    pending = len([row for row in project.load_registry() if row not in statuses])
+    eta = runtimes.cohort_eta(list(lefts.values()), pending, step_medians)
+    summary = "{0} running, {1} pending".format(len(running), pending)
+    if eta != None:
+        summary += ", ETA {0}".format(runtimes.hours(eta))
+    extra = [dashboard.state_update("Project", project.status_columns()[0], "Incomplete", text=summary)]
+    stale = provenance.stale(project.subjects_dir, statuses, workers=workers)
+    texts.update(provenance.texts(stale))
+    return len(running), scan.sync(project.monitor_dir, provenance.mark(statuses, stale), project.is_longitudinal, texts=texts, extra=extra)
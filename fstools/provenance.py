@@ -0,0 +1,62 @@
+import os
+from fstools import util
+from fstools import dashboard
+
+# Per-directory record of when each input of a base or long run had last finished.
+PROVENANCE = "fsjob.provenance.json"
+
+def finished_time(subject_path):
+    """mtime of recon-all.done, i.e. when the directory was last finished, or None."""
+    try:
+        return os.path.getmtime(os.path.join(subject_path, "scripts", "recon-all.done"))
+    except OSError:
+        return None
+
+def inputs(fs_id, fs_ids):
+    """The directories a base (its subject's cross timepoints) or long (its cross and base) directory is built from."""
+    phase = dashboard.phase_of(fs_id)
+    if phase == "long":
+        cross, base = fs_id.split(".long.", 1)
+        return [cross, base]
+    elif phase == "base":
+        return sorted(row for row in dashboard.locate(fs_id, fs_ids)[1] if dashboard.phase_of(row) == "cross")
+    return []
+
+def record(subjects_dir, target, reads):
+    """Record which version of each input target was built from, at the end of a successful base or long run."""
+    if reads and os.path.isdir(os.path.join(subjects_dir, target, "scripts")):
+        util.write_json(os.path.join(subjects_dir, target, "scripts", PROVENANCE), dict((read, finished_time(os.path.join(subjects_dir, read))) for read in reads))
+
+def stale(subjects_dir, statuses, workers=8):
+    """
+    {fs_id: [changed inputs]} for every finished base or long directory built from an input that has
+    finished again since (or a new timepoint, for a base). A stale base makes each of its longs stale too.
+    Directories run before provenance was recorded are compared against their own recon-all.done.
+    """
+    finished = sorted(fs_id for fs_id in statuses if statuses[fs_id] == "Finished")
+    times = dict(zip(finished, util.pool_map(lambda fs_id: finished_time(os.path.join(subjects_dir, fs_id)), finished, workers=workers)))
+    targets = [fs_id for fs_id in finished if dashboard.phase_of(fs_id) != "cross"]
+    recorded = dict(zip(targets, util.pool_map(lambda fs_id: util.read_json(os.path.join(subjects_dir, fs_id, "scripts", PROVENANCE)), targets, workers=workers)))
+    result = {}
+    # Bases first, so each long knows whether its base is stale.
+    for fs_id in sorted(targets, key=lambda fs_id: dashboard.phase_of(fs_id) != "base"):
+        reads = inputs(fs_id, statuses)
+        built = recorded[fs_id]
+        if built == None:
+            built = dict((read, times[fs_id]) for read in reads)
+        changed = [read for read in reads if times.get(read) != None and (built.get(read) == None or times[read] > built[read])]
+        if dashboard.phase_of(fs_id) == "long" and reads[1] in result and reads[1] not in changed:
+            changed.append(reads[1])
+        if changed:
+            result[fs_id] = changed
+    return result
+
+def texts(stale_dirs):
+    return dict((fs_id, "Stale: {0} changed".format(", ".join(changed))) for fs_id, changed in stale_dirs.items())
+
+def mark(statuses, stale_dirs):
+    """statuses with the stale directories marked Stale, for scan.sync."""
+    statuses = dict(statuses)
+    for fs_id in stale_dirs:
+        statuses[fs_id] = "Stale"
+    return statuses
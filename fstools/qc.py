@@ -0,0 +1,74 @@
+import os
+import csv
+from fstools import stats
+from fstools import dashboard
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Scales the median absolute deviation to the standard deviation of a normal distribution.
+MAD_SCALE = 0.6745
+# Implausible values show up in volumes and thicknesses; areas and curvatures mostly follow them.
+MEASURES = ["volume", "thickness"]
+
+def load_matrix(matrix_dir, measures=MEASURES):
+    """
+    Load the extracted matrices as one subjects x columns matrix over every table of the given measures.
+    Returns (subject ids, '<table> <column>' labels, values). The whole-brain measures repeated in every
+    aparc table are only taken from aseg, so they are not weighted once per table.
+    """
+    subjects = [str(subject) for subject in numpy.load(os.path.join(matrix_dir, "subjects.npy"))]
+    names = [name for name in stats.table_names() if name.rsplit("-", 1)[-1] in measures and os.path.exists(os.path.join(matrix_dir, name + ".npy"))]
+    labels = []
+    blocks = []
+    for name in sorted(names):
+        columns = numpy.load(os.path.join(matrix_dir, name + ".columns.npy"))
+        keep = [position for position, column in enumerate(columns) if name == "aseg-volume" or column not in stats.GLOBAL_MEASURES]
+        labels.extend("{0} {1}".format(name, columns[position]) for position in keep)
+        blocks.append(numpy.load(os.path.join(matrix_dir, name + ".npy"), mmap_mode="r")[:, keep])
+    values = numpy.hstack(blocks) if blocks else numpy.zeros((len(subjects), 0))
+    return subjects, labels, values
+
+def robust_z(values):
+    """Robust z-score of every value against its column's median and MAD. Missing values and constant columns score 0."""
+    median = numpy.nanmedian(values, axis=0)
+    mad = numpy.nanmedian(numpy.abs(values - median), axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        scores = MAD_SCALE * (values - median) / mad
+    scores[:, ~(mad > 0)] = 0.0
+    scores[numpy.isnan(scores)] = 0.0
+    return scores
+
+def outliers(subjects, labels, values, threshold=3.5):
+    """
+    Score every subject in one pass. Returns a (fs_id, number of outlying columns, worst column, its z-score) row
+    per subject, most outlying first.
+    """
+    if not subjects or not labels:
+        return [(fs_id, 0, "", 0.0) for fs_id in subjects]
+    scores = robust_z(values)
+    counts = (numpy.abs(scores) > threshold).sum(axis=1)
+    worst = numpy.abs(scores).argmax(axis=1)
+    results = [(fs_id, int(counts[row]), labels[worst[row]], float(scores[row, worst[row]])) for row, fs_id in enumerate(subjects)]
+    return sorted(results, key=lambda result: (-result[1], -abs(result[3]), result[0]))
+
+def write_report(path, results):
+    with open(path, "w") as report_file:
+        writer = csv.writer(report_file, lineterminator="\n")
+        writer.writerow(["id", "outliers", "worst", "z"])
+        for fs_id, count, label, score in results:
+            writer.writerow([fs_id, count, label, "{0:.2f}".format(score)])
+
+def updates(results, rows, column="QC"):
+    """Cell updates for every subject with a dashboard row: Error if any column is an outlier, Finished otherwise."""
+    cells = []
+    for fs_id, count, label, score in results:
+        if fs_id not in rows:
+            continue
+        if count:
+            cells.append(dashboard.state_update(fs_id, column, "Error", text="QC: {0} outliers".format(count)))
+        else:
+            cells.append(dashboard.state_update(fs_id, column, "Finished", text="QC: OK"))
+    return cells
@@ -0,0 +1,69 @@
+import os
+import shutil
+import hashlib
+from fstools import util
+from fstools import fscache
+from fstools import resume
+
+# Per-subject record of the input key a subject was computed from.
+INPUTS = "fsjob.inputs.json"
+
+def freesurfer_version(freesurfer_home, config):
+    """The cached install name if the project has one, else FreeSurfer's build stamp."""
+    if config.get("FREESURFER_VERSION"):
+        return config["FREESURFER_VERSION"]
+    try:
+        with open(os.path.join(freesurfer_home, "build-stamp.txt"), "r") as stamp_file:
+            return stamp_file.read().strip()
+    except IOError:
+        return freesurfer_home
+
+def key(inputs, version, flags):
+    """Digest of the input images' contents, the FreeSurfer version and the recon-all flags."""
+    digest = hashlib.sha1()
+    for part in [fscache.file_md5(path) for path in inputs] + [version] + list(flags):
+        digest.update(part.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+def inputs_loc(subject_path):
+    return os.path.join(subject_path, "scripts", INPUTS)
+
+def lookup(index_dir, subjects_dir, input_key, target):
+    """
+    A finished subject other than target computed from the same key, or None. The index entry is
+    checked against the subject's own record, so subjects that were removed or recomputed are not reused.
+    """
+    try:
+        with open(os.path.join(index_dir, input_key), "r") as entry_file:
+            source = entry_file.read().strip()
+    except IOError:
+        return None
+    source_path = os.path.join(subjects_dir, source)
+    if source == target or not resume.finished(source_path):
+        return None
+    if (util.read_json(inputs_loc(source_path)) or {}).get("key") != input_key:
+        return None
+    return source
+
+def record(index_dir, subjects_dir, input_key, inputs, target, index=True):
+    """Record that target was computed from input_key, in the subject and (if index) in the project index."""
+    if not os.path.isdir(os.path.join(subjects_dir, target, "scripts")):
+        return
+    util.write_json(inputs_loc(os.path.join(subjects_dir, target)), {"key":input_key, "inputs":inputs})
+    if not index:
+        return
+    util.makedirs(index_dir)
+    temp = os.path.join(index_dir, "{0}.{1}.tmp".format(input_key, os.getpid()))
+    with open(temp, "w") as entry_file:
+        entry_file.write(target + "\n")
+    os.rename(temp, os.path.join(index_dir, input_key))
+
+def clone(subjects_dir, source, target):
+    """Copy the subject directory source to target, through a staging directory renamed into place."""
+    staging = os.path.join(subjects_dir, ".{0}.staging.{1}".format(target, os.getpid()))
+    try:
+        shutil.copytree(os.path.join(subjects_dir, source), staging, symlinks=True)
+    except EnvironmentError:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    os.rename(staging, os.path.join(subjects_dir, target))
@@ -0,0 +1,78 @@
+import os
+from fstools import scan
+from fstools import util
+from fstools import statuslog
+
+# Where each recon-all entry point starts, latest first: (first step it runs, recon-all flags).
+ENTRY_POINTS = [
+    ("Curvature Stats", ["-autorecon3"]),
+    ("Fill", ["-autorecon2-wm", "-autorecon3"]),
+    ("Intensity Normalization2", ["-autorecon2-cp", "-autorecon3"]),
+    ("EM Registration", ["-autorecon2", "-autorecon3"]),
+    ("MotionCor", ["-all"]),
+]
+CHECKPOINT = "fsjob.checkpoint"
+# Exit code telling Condor (checkpoint_exit_code in the submit files) the job saved its place and should be restarted.
+CHECKPOINT_EXIT_CODE = 85
+
+def last_step(subject_path):
+    """The last step recon-all started, from recon-all-status.log, or None if it has not started any."""
+    lines, offset = statuslog.tail(os.path.join(subject_path, "scripts", "recon-all-status.log"), 0)
+    last = None
+    for line in lines:
+        marker = statuslog.parse_marker(line)
+        if marker != None and statuslog.step_info(marker[0]) != None:
+            last = statuslog.step_info(marker[0])[0]
+    return last
+
+def imported(subject_path):
+    """True if recon-all got past importing the input images: the first orig volume exists, or a step was started."""
+    return os.path.exists(os.path.join(subject_path, "mri", "orig", "001.mgz")) or last_step(subject_path) != None
+
+def finished(subject_path):
+    """True if the last run finished: recon-all.done is newer than the status log and nothing is running or failed."""
+    scripts = os.path.join(subject_path, "scripts")
+    if not os.path.isdir(scripts) or scan.classify([entry.name for entry in util.list_dir(scripts)]) != "Finished":
+        return False
+    status_loc = os.path.join(scripts, "recon-all-status.log")
+    return not os.path.exists(status_loc) or os.path.getmtime(os.path.join(scripts, "recon-all.done")) >= os.path.getmtime(status_loc)
+
+def entry_point(subject_path):
+    """
+    recon-all flags that redo only what is left: the latest entry point at or before the step that was
+    interrupted (the last one started). Returns ([], step) if the last run finished.
+    """
+    if finished(subject_path):
+        return [], None
+    step = last_step(subject_path)
+    if step == None:
+        return ["-all"], None
+    for start, flags in ENTRY_POINTS:
+        if statuslog.STEP_INDEX[step] >= statuslog.STEP_INDEX[start]:
+            return flags, step
+    return ["-all"], step
+
+def clear_running(subject_path):
+    """Remove the IsRunning files a killed recon-all leaves behind, which would stop the next run from starting."""
+    scripts = os.path.join(subject_path, "scripts")
+    if os.path.isdir(scripts):
+        for entry in util.list_dir(scripts):
+            if entry.name.startswith("IsRunning"):
+                os.unlink(entry.path)
+
+def checkpoint_stage(subject_path):
+    """The stage that was checkpointed in subject_path, if a job was interrupted there."""
+    try:
+        with open(os.path.join(subject_path, "scripts", CHECKPOINT), "r") as checkpoint_file:
+            return checkpoint_file.read().strip()
+    except IOError:
+        return None
+
+def write_checkpoint(subject_path, stage):
+    if os.path.isdir(os.path.join(subject_path, "scripts")):
+        with open(os.path.join(subject_path, "scripts", CHECKPOINT), "w") as checkpoint_file:
+            checkpoint_file.write(stage + "\n")
+
+def clear_checkpoint(subject_path):
+    if os.path.exists(os.path.join(subject_path, "scripts", CHECKPOINT)):
+        os.unlink(os.path.join(subject_path, "scripts", CHECKPOINT))
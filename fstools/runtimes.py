@@ -0,0 +1,142 @@
+import os
+import re
+import time
+import sqlite3
+from fstools import util
+from fstools import statuslog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (subject TEXT, stage TEXT, step TEXT, start REAL, end REAL, host TEXT, PRIMARY KEY (subject, step, start));
+CREATE INDEX IF NOT EXISTS steps_by_step ON steps (step);
+CREATE TABLE IF NOT EXISTS logs (subject TEXT PRIMARY KEY, offset INTEGER, step TEXT, stage TEXT, percent INTEGER, start REAL, host TEXT);
+"""
+LOG_FIELDS = ["offset", "step", "stage", "percent", "start", "host"]
+HOST = re.compile(r"^(?:Linux|Darwin)\s+(\S+)\s", re.MULTILINE)
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def log_state(connection, fs_id):
+    row = connection.execute("SELECT offset, step, stage, percent, start, host FROM logs WHERE subject = ?", (fs_id,)).fetchone()
+    if row == None:
+        return {"offset":0}
+    return dict(zip(LOG_FIELDS, row))
+
+def open_subjects(connection):
+    """Subjects with a step still open, i.e. running when they were last read."""
+    return [row[0] for row in connection.execute("SELECT subject FROM logs WHERE step IS NOT NULL")]
+
+def read_host(subject_path):
+    """Host of the run, from the uname line recon-all writes near the top of recon-all.log."""
+    try:
+        with open(os.path.join(subject_path, "scripts", "recon-all.log"), "rb") as log_file:
+            match = HOST.search(log_file.read(16384).decode("utf-8", "replace"))
+    except IOError:
+        return None
+    return match.group(1) if match else None
+
+def parse(subjects_dir, fs_id, state, status):
+    """
+    Read the new part of a subject's recon-all-status.log.
+    Returns the updated log state and the (subject, stage, step, start, end, host) rows of steps that closed.
+    Each step ends where the next marker starts; the last one ends when recon-all.done was written.
+    """
+    subject_path = os.path.join(subjects_dir, fs_id)
+    path = os.path.join(subject_path, "scripts", "recon-all-status.log")
+    state = dict(state)
+    if os.path.exists(path) and os.path.getsize(path) < state.get("offset", 0):
+        state = {"offset":0}
+    lines, state["offset"] = statuslog.tail(path, state.get("offset", 0))
+    closed = []
+    for line in lines:
+        marker = statuslog.parse_marker(line)
+        if marker == None:
+            continue
+        name, hemi, stamp = marker
+        if state.get("host") == None:
+            state["host"] = read_host(subject_path)
+        if state.get("step") != None:
+            closed.append((fs_id, state["stage"], state["step"], state["start"], stamp, state["host"]))
+        info = statuslog.step_info(name)
+        state["step"] = name if hemi == None else "{0} {1}".format(name, hemi)
+        state["stage"] = info[1] if info else None
+        state["percent"] = info[2] if info else None
+        state["start"] = stamp
+    if status in ["Finished", "Error"] and state.get("step") != None:
+        # A step cut short by an error says nothing about how long it takes, so only finished runs close it.
+        if status == "Finished":
+            try:
+                end = os.path.getmtime(os.path.join(subject_path, "scripts", "recon-all.done"))
+            except OSError:
+                end = None
+            closed.append((fs_id, state["stage"], state["step"], state["start"], end, state["host"]))
+        state["step"] = state["stage"] = state["percent"] = state["start"] = None
+    return state, closed
+
+def store(connection, fs_id, state, closed):
+    connection.executemany("INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?)", closed)
+    connection.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?, ?)", [fs_id] + [state.get(field) for field in LOG_FIELDS])
+
+def stage_hours(step_medians):
+    totals = {}
+    for step, duration in step_medians.items():
+        info = statuslog.step_info(step[:-3] if step[-3:] in [" lh", " rh"] else step)
+        stage = info[1] if info else "other"
+        totals[stage] = totals.get(stage, 0.0) + duration
+    return totals
+
+def medians(connection):
+    """Median duration in seconds of every step seen finishing, keyed by step (with hemisphere)."""
+    durations = {}
+    for step, duration in connection.execute("SELECT step, end - start FROM steps WHERE end IS NOT NULL AND end >= start"):
+        durations.setdefault(step, []).append(duration)
+    result = {}
+    for step, values in durations.items():
+        values.sort()
+        middle = len(values) // 2
+        result[step] = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+    return result
+
+def step_order(step):
+    name, hemi = step, ""
+    if step[-3:] in [" lh", " rh"]:
+        name, hemi = step[:-3], step[-2:]
+    info = statuslog.step_info(name)
+    return (statuslog.STEP_INDEX[info[0]] if info else len(statuslog.STEPS), hemi)
+
+def remaining(state, step_medians, now=None):
+    """Predicted seconds left for a running subject: the rest of its current step plus every later step."""
+    if state.get("step") == None or state["step"] not in step_medians:
+        return None
+    now = now if now != None else time.time()
+    current = step_order(state["step"])
+    left = max(0.0, step_medians[state["step"]] - (now - state["start"]))
+    return left + sum(duration for step, duration in step_medians.items() if step_order(step) > current)
+
+def cohort_eta(running_remaining, pending, step_medians):
+    """
+    Predicted seconds until the whole cohort is done, assuming the current number of
+    concurrent jobs keeps draining the pending subjects.
+    """
+    full_run = sum(step_medians.values())
+    known = [value for value in running_remaining if value != None]
+    if not full_run or (not known and not pending):
+        return None
+    slots = max(1, len(running_remaining))
+    return max(known + [0.0]) if not pending else (sum(known) + pending * full_run) / slots
+
+def hours(seconds):
+    return "{0:.1f}h".format(seconds / 3600.0)
+
+def update(connection, subjects_dir, statuses, fs_ids, workers=8):
+    """Parse the logs of fs_ids in a thread pool and store the results. Returns {fs_id: log state}."""
+    fs_ids = sorted(fs_ids)
+    states = dict((fs_id, log_state(connection, fs_id)) for fs_id in fs_ids)
+    results = util.pool_map(lambda fs_id: parse(subjects_dir, fs_id, states[fs_id], statuses.get(fs_id)), fs_ids, workers=workers)
+    for fs_id, (state, closed) in zip(fs_ids, results):
+        store(connection, fs_id, state, closed)
+        states[fs_id] = state
+    connection.commit()
+    return states
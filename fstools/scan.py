@@ -0,0 +1,64 @@
+import os
+from fstools import util
+from fstools import dashboard
+
+# Directories FreeSurfer ships or creates that are not subjects.
+IGNORED = ["fsaverage", "fsaverage3", "fsaverage4", "fsaverage5", "fsaverage6", "fsaverage_sym", "lh.EC_average", "rh.EC_average", "cvs_avg35", "cvs_avg35_inMNI152"]
+
+def classify(names):
+    """Status of a subject from the file names in its scripts directory."""
+    if any(name.startswith("IsRunning") for name in names):
+        return "Running"
+    elif "recon-all.error" in names:
+        return "Error"
+    elif "recon-all.done" in names:
+        return "Finished"
+    return "Incomplete"
+
+def scan_subject(item):
+    """
+    Check one subject, reusing the cached status when its scripts directory has not changed.
+    recon-all creates and removes its marker files in scripts/, so that directory's mtime changes with them.
+    """
+    path, cached = item
+    scripts = os.path.join(path, "scripts")
+    try:
+        mtime = os.stat(scripts).st_mtime
+    except OSError:
+        return None, "Not Started"
+    if cached != None and cached[0] == mtime:
+        return mtime, cached[1]
+    return mtime, classify([entry.name for entry in util.list_dir(scripts)])
+
+def scan(subjects_dir, cache_loc=None, workers=8):
+    """
+    Status of every subject directory in subjects_dir, as a dict of fs_id: status.
+    Results are cached in cache_loc by scripts directory mtime, so repeat scans cost one stat per subject.
+    """
+    cache = util.read_json(cache_loc, {}) if cache_loc else {}
+    entries = [entry for entry in util.list_dir(subjects_dir) if entry.is_dir() and not entry.name.startswith(".") and entry.name not in IGNORED]
+    results = util.pool_map(scan_subject, [(entry.path, cache.get(entry.name)) for entry in entries], workers=workers)
+    statuses = {}
+    new_cache = {}
+    for entry, (mtime, status) in zip(entries, results):
+        statuses[entry.name] = status
+        if mtime != None:
+            new_cache[entry.name] = [mtime, status]
+    if cache_loc and new_cache != cache:
+        util.write_json(cache_loc, new_cache)
+    return statuses
+
+def sync(monitor_dir, statuses, is_longitudinal, texts=None, extra=None):
+    """
+    Write scanned statuses into the dashboard status columns in one batch.
+    texts optionally maps fs_id to more detailed cell text than the bare status;
+    extra is a list of further cell updates to send in the same batch.
+    """
+    rows = set(dashboard.rows(monitor_dir))
+    texts = texts or {}
+    updates = list(extra or [])
+    for fs_id in sorted(statuses):
+        phase, targets = dashboard.locate(fs_id, rows)
+        for row in targets:
+            updates.append(dashboard.state_update(row, dashboard.status_column(phase, is_longitudinal), statuses[fs_id], text=texts.get(fs_id)))
+    return dashboard.push(monitor_dir, updates)
@@ -0,0 +1,103 @@
+import os
+
+HEMIS = ["lh", "rh"]
+# (parcellation file name, label used in table names)
+PARCELLATIONS = [("aparc", "desikankilliany"), ("aparc.a2009s", "destrieux")]
+# (aparcstats2table --meas, stats file column, whole-cortex measure reported with it)
+MEASURES = [("area", "SurfArea", "WhiteSurfArea"), ("meancurv", "MeanCurv", None), ("thickness", "ThickAvg", "MeanThickness"), ("volume", "GrayVol", None)]
+# Whole-brain measures aparcstats2table appends to every table.
+GLOBAL_MEASURES = ["BrainSegVolNotVent", "eTIV"]
+# asegstats2table names these columns differently from the stats file.
+ASEG_RENAMES = {"eTIV":"EstimatedTotalIntraCranialVol"}
+# Changed whenever the records parse_subject returns change, so cached records are parsed again.
+RECORD_VERSION = 2
+
+
+def to_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def read_stats(path):
+    """
+    Parse a FreeSurfer .stats file.
+    Returns (measures, rows): measures is a list of (name, value) from the '# Measure' lines,
+    rows a list of dicts keyed by the '# ColHeaders' names.
+    """
+    measures = []
+    headers = []
+    rows = []
+    with open(path, "r") as stats_file:
+        for line in stats_file:
+            if line.startswith("# Measure "):
+                fields = [field.strip() for field in line[len("# Measure "):].split(",")]
+                if len(fields) >= 4:
+                    measures.append((fields[1], to_number(fields[3])))
+            elif line.startswith("# ColHeaders"):
+                headers = line.split()[2:]
+            elif not line.startswith("#") and line.strip() and headers:
+                rows.append(dict(zip(headers, line.split())))
+    return measures, rows
+
+def table_name(hemi, parcellation, measure):
+    label = dict(PARCELLATIONS)[parcellation]
+    return "{0}_aparc-{1}-{2}".format(hemi, label, measure)
+
+def aparc_tables(hemi, parcellation, measures, rows):
+    """Every measure table for one hemisphere and parcellation, from a single parsed stats file."""
+    measures = dict(measures)
+    tables = {}
+    for measure, column, cortex in MEASURES:
+        values = [["{0}_{1}_{2}".format(hemi, row["StructName"], measure), to_number(row.get(column, ""))] for row in rows]
+        if cortex != None and cortex in measures:
+            values.append(["{0}_{1}_{2}".format(hemi, cortex, measure), measures[cortex]])
+        values.extend([[name, measures[name]] for name in GLOBAL_MEASURES if name in measures])
+        tables[table_name(hemi, parcellation, measure)] = values
+    return tables
+
+def aseg_table(measures, rows):
+    values = [[row["StructName"], to_number(row.get("Volume_mm3", ""))] for row in rows]
+    values.extend([[ASEG_RENAMES.get(name, name), value] for name, value in measures])
+    return {"aseg-volume": values}
+
+def stats_files(subjects_dir, fs_id):
+    """The stats files read for a subject, as (path, parser key) pairs."""
+    files = []
+    for parcellation, label in PARCELLATIONS:
+        for hemi in HEMIS:
+            files.append((os.path.join(subjects_dir, fs_id, "stats", "{0}.{1}.stats".format(hemi, parcellation)), (hemi, parcellation)))
+    files.append((os.path.join(subjects_dir, fs_id, "stats", "aseg.stats"), "aseg"))
+    return files
+
+def parse_subject(item):
+    """
+    Read each of a subject's stats files once and pull every table's values from it.
+    Returns {"id": fs_id, "tables": {table name: [[column, value], ...]}, "missing": [paths]}.
+    """
+    subjects_dir, fs_id = item
+    record = {"id":fs_id, "tables":{}, "missing":[]}
+    for path, key in stats_files(subjects_dir, fs_id):
+        try:
+            measures, rows = read_stats(path)
+        except IOError:
+            record["missing"].append(path)
+            continue
+        if key == "aseg":
+            record["tables"].update(aseg_table(measures, rows))
+        else:
+            record["tables"].update(aparc_tables(key[0], key[1], measures, rows))
+    return record
+
+def table_names():
+    names = [table_name(hemi, parcellation, measure[0]) for parcellation, label in PARCELLATIONS for measure in MEASURES for hemi in HEMIS]
+    return names + ["aseg-volume"]
+
+def table_header(name):
+    """First header cell, as written by aparcstats2table/asegstats2table."""
+    if name == "aseg-volume":
+        return "Measure:volume"
+    hemi, rest = name.split("_", 1)
+    label, measure = rest[len("aparc-"):].rsplit("-", 1)
+    parcellation = [parc for parc, parc_label in PARCELLATIONS if parc_label == label][0]
+    return "{0}.{1}.{2}".format(hemi, parcellation, measure)
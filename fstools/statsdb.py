@@ -0,0 +1,73 @@
+import json
+import time
+import hashlib
+import sqlite3
+from fstools import columnar
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (id INTEGER PRIMARY KEY, fs_id TEXT UNIQUE, subject TEXT, timepoint TEXT);
+CREATE TABLE IF NOT EXISTS regions (id INTEGER PRIMARY KEY, hemisphere TEXT, parcellation TEXT, region TEXT, UNIQUE (hemisphere, parcellation, region));
+CREATE TABLE IF NOT EXISTS measures (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS stat_values (subject_id INTEGER, region_id INTEGER, measure_id INTEGER, value REAL, PRIMARY KEY (subject_id, region_id, measure_id));
+CREATE INDEX IF NOT EXISTS stat_values_by_region ON stat_values (region_id, measure_id);
+CREATE INDEX IF NOT EXISTS subjects_by_timepoint ON subjects (timepoint);
+CREATE TABLE IF NOT EXISTS provenance (subject_id INTEGER PRIMARY KEY, digest TEXT, missing TEXT, updated REAL);
+CREATE VIEW IF NOT EXISTS stats AS
+    SELECT subjects.fs_id, subjects.subject, subjects.timepoint, regions.hemisphere, regions.parcellation, regions.region, measures.name AS measure, stat_values.value
+    FROM stat_values
+    JOIN subjects ON subjects.id = stat_values.subject_id
+    JOIN regions ON regions.id = stat_values.region_id
+    JOIN measures ON measures.id = stat_values.measure_id;
+"""
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def digest(record):
+    return hashlib.sha1(json.dumps([record["tables"], record["missing"]], sort_keys=True).encode("utf-8")).hexdigest()
+
+def lookup(connection, cache, table, columns, values):
+    """Id of the row of table with the given column values, inserting it if needed."""
+    key = (table,) + tuple(values)
+    if key not in cache:
+        where = " AND ".join("{0} IS ?".format(column) for column in columns)
+        row = connection.execute("SELECT id FROM {0} WHERE {1}".format(table, where), values).fetchone()
+        if row == None:
+            cursor = connection.execute("INSERT INTO {0} ({1}) VALUES ({2})".format(table, ", ".join(columns), ", ".join("?" * len(columns))), values)
+            cache[key] = cursor.lastrowid
+        else:
+            cache[key] = row[0]
+    return cache[key]
+
+def update(connection, records, sessions=None):
+    """
+    Store extraction records, replacing the values of subjects whose stats changed since they were
+    last stored; unchanged subjects are skipped. sessions maps fs_ids to (subject, timepoint) for
+    records that do not carry them. Returns the number of subjects written.
+    """
+    sessions = sessions or {}
+    cache = {}
+    written = 0
+    for record in records:
+        subject, timepoint = sessions.get(record["id"], (record.get("subject"), record.get("timepoint")))
+        subject_id = lookup(connection, cache, "subjects", ["fs_id"], [record["id"]])
+        connection.execute("UPDATE subjects SET subject = ?, timepoint = ? WHERE id = ?", (subject, timepoint, subject_id))
+        current = digest(record)
+        stored = connection.execute("SELECT digest FROM provenance WHERE subject_id = ?", (subject_id,)).fetchone()
+        if stored != None and stored[0] == current:
+            continue
+        connection.execute("DELETE FROM stat_values WHERE subject_id = ?", (subject_id,))
+        rows = []
+        for fs_id, table, hemisphere, parcellation, measure, region, value in columnar.long_rows([record]):
+            if value == None:
+                continue
+            # Whole-brain and midline aseg values belong to no hemisphere.
+            region_id = lookup(connection, cache, "regions", ["hemisphere", "parcellation", "region"], [hemisphere or None, parcellation, region])
+            rows.append((subject_id, region_id, lookup(connection, cache, "measures", ["name"], [measure]), value))
+        connection.executemany("INSERT OR REPLACE INTO stat_values VALUES (?, ?, ?, ?)", rows)
+        connection.execute("INSERT OR REPLACE INTO provenance VALUES (?, ?, ?, ?)", (subject_id, current, json.dumps(record["missing"]), time.time()))
+        written += 1
+    connection.commit()
+    return written
@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import datetime
+# Imported up front: strptime's lazy import is not thread-safe under Python 2.
+import _strptime
+
+# recon-all step markers in pipeline order: (marker, stage, percent of a full -all run done when the step starts).
+STEPS = [
+    ("MotionCor", "autorecon1", 0),
+    ("Talairach", "autorecon1", 1),
+    ("Talairach Failure Detection", "autorecon1", 2),
+    ("Nu Intensity Correction", "autorecon1", 2),
+    ("Intensity Normalization", "autorecon1", 4),
+    ("Skull Stripping", "autorecon1", 5),
+    ("EM Registration", "autorecon2", 8),
+    ("CA Normalize", "autorecon2", 12),
+    ("CA Reg", "autorecon2", 13),
+    ("CA Reg Inv", "autorecon2", 28),
+    ("Remove Neck", "autorecon2", 29),
+    ("SkullLTA", "autorecon2", 29),
+    ("SubCort Seg", "autorecon2", 30),
+    ("CC Seg", "autorecon2", 34),
+    ("Merge ASeg", "autorecon2", 34),
+    ("Intensity Normalization2", "autorecon2", 35),
+    ("Mask BFS", "autorecon2", 37),
+    ("WM Segmentation", "autorecon2", 37),
+    ("Fill", "autorecon2", 38),
+    ("Tessellate", "autorecon2", 39),
+    ("Smooth1", "autorecon2", 40),
+    ("Inflation1", "autorecon2", 40),
+    ("QSphere", "autorecon2", 41),
+    ("Fix Topology Copy", "autorecon2", 44),
+    ("Fix Topology", "autorecon2", 44),
+    ("Make White Surf", "autorecon2", 55),
+    ("Smooth2", "autorecon2", 58),
+    ("Inflation2", "autorecon2", 58),
+    ("Curv .H and .K", "autorecon2", 59),
+    ("Curvature Stats", "autorecon3", 60),
+    ("Sphere", "autorecon3", 60),
+    ("Surf Reg", "autorecon3", 66),
+    ("Jacobian white", "autorecon3", 75),
+    ("AvgCurv", "autorecon3", 75),
+    ("Cortical Parc", "autorecon3", 76),
+    ("Make Pial Surf", "autorecon3", 77),
+    ("Surf Volume", "autorecon3", 84),
+    ("Cortical ribbon mask", "autorecon3", 85),
+    ("Parcellation Stats", "autorecon3", 88),
+    ("Cortical Parc 2", "autorecon3", 89),
+    ("Parcellation Stats 2", "autorecon3", 90),
+    ("Cortical Parc 3", "autorecon3", 91),
+    ("Parcellation Stats 3", "autorecon3", 92),
+    ("WM/GM Contrast", "autorecon3", 92),
+    ("Relabel Hypointensities", "autorecon3", 93),
+    ("AParc-to-ASeg", "autorecon3", 94),
+    ("APas-to-ASeg", "autorecon3", 96),
+    ("ASeg Stats", "autorecon3", 96),
+    ("WMParc", "autorecon3", 97),
+    ("BA Labels", "autorecon3", 98),
+    ("BA_exvivo Labels", "autorecon3", 98),
+]
+STEP_INDEX = dict((step[0], index) for index, step in enumerate(STEPS))
+
+MARKER = re.compile(r"^#@#\s+(.*?)\s+(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s+(\w{3}\s+\d+\s+\d\d:\d\d:\d\d)\s+(?:\S+\s+)?(\d{4})\s*$")
+
+def parse_marker(line):
+    """
+    Parse a '#@# <Step> [lh|rh] <date>' line from recon-all-status.log.
+    Returns (step, hemi, epoch seconds), or None for any other line.
+    """
+    match = MARKER.match(line.strip())
+    if match == None:
+        return None
+    name, hemi = match.group(1), None
+    if name[-3:] in [" lh", " rh"]:
+        name, hemi = name[:-3], name[-2:]
+    try:
+        stamp = datetime.datetime.strptime("{0} {1}".format(match.group(2), match.group(3)), "%b %d %H:%M:%S %Y")
+    except ValueError:
+        return None
+    return name, hemi, time.mktime(stamp.timetuple())
+
+def step_info(name):
+    """(canonical step, stage, percent) for a marker name, or None if the step is not known."""
+    best = None
+    for step in STEPS:
+        if name == step[0] or name.startswith(step[0] + " "):
+            if best == None or len(step[0]) > len(best[0]):
+                best = step
+    return best
+
+def tail(path, offset):
+    """
+    Read the complete lines appended to path since byte offset.
+    Returns (lines, new offset). A file shorter than offset was replaced, so it is read from the start.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return [], 0
+    if size < offset:
+        offset = 0
+    if size == offset:
+        return [], offset
+    with open(path, "rb") as log_file:
+        log_file.seek(offset)
+        data = log_file.read(size - offset)
+    end = data.rfind(b"\n") + 1
+    return data[:end].decode("utf-8", "replace").splitlines(), offset + end
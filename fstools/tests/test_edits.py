@@ -0,0 +1,63 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from fstools import edits
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.subject_path = tempfile.mkdtemp()
+        for directory in ["scripts", "mri", "tmp", "transforms"]:
+            os.makedirs(os.path.join(self.subject_path, directory))
+        for relative in ["mri/brainmask.mgz", "mri/wm.mgz"]:
+            self.write(relative, "original")
+
+    def tearDown(self):
+        shutil.rmtree(self.subject_path)
+
+    def write(self, relative, text, mtime=None):
+        path = os.path.join(self.subject_path, relative)
+        with open(path, "w") as data_file:
+            data_file.write(text)
+        if mtime != None:
+            os.utime(path, (mtime, mtime))
+
+    def test_no_edits(self):
+        edits.snapshot(self.subject_path)
+        self.assertEqual(edits.plan(self.subject_path), (None, []))
+
+    def test_single_edit(self):
+        edits.snapshot(self.subject_path)
+        self.write("mri/wm.mgz", "edited")
+        self.assertEqual(edits.plan(self.subject_path), ("wmRerun", ["mri/wm.mgz"]))
+
+    def test_earliest_edit_wins(self):
+        edits.snapshot(self.subject_path)
+        self.write("mri/wm.mgz", "edited")
+        self.write("tmp/control.dat", "points")
+        self.write("mri/brainmask.mgz", "edited")
+        self.assertEqual(edits.plan(self.subject_path), ("maskRerun", ["mri/brainmask.mgz", "tmp/control.dat", "mri/wm.mgz"]))
+
+    def test_touched_without_change(self):
+        edits.snapshot(self.subject_path)
+        self.write("mri/wm.mgz", "original", time.time() + 60)
+        self.assertEqual(edits.plan(self.subject_path), (None, []))
+
+    def test_removed_file(self):
+        edits.snapshot(self.subject_path)
+        os.unlink(os.path.join(self.subject_path, "mri", "brainmask.mgz"))
+        self.assertEqual(edits.plan(self.subject_path), ("maskRerun", ["mri/brainmask.mgz"]))
+
+    def test_without_snapshot(self):
+        now = time.time()
+        self.write("scripts/recon-all.done", "", now)
+        self.write("mri/brainmask.mgz", "original", now - 60)
+        self.write("mri/wm.mgz", "edited", now + 60)
+        self.assertEqual(edits.plan(self.subject_path), ("wmRerun", ["mri/wm.mgz"]))
+
+    def test_without_snapshot_or_run(self):
+        self.assertEqual(edits.plan(self.subject_path), (None, []))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import shutil
+import signal
+import tempfile
+import unittest
+from fstools import failures
+
+class ClassifyTest(unittest.TestCase):
+    def test_memory(self):
+        lines = ["#@# CA Reg Mon Jan  8 10:00:00 UTC 2024", "terminate called after throwing an instance of 'std::bad_alloc'", "ERROR: mri_ca_register failed"]
+        self.assertEqual(failures.classify(1, lines), ("memory", "terminate called after throwing an instance of 'std::bad_alloc'"))
+
+    def test_killed(self):
+        self.assertEqual(failures.classify(-signal.SIGKILL, []), ("memory", "Killed (signal 9)"))
+        self.assertEqual(failures.classify(137, ["ERROR: mri_em_register failed"])[0], "memory")
+
+    def test_transient(self):
+        lines = ["mri_convert: could not open /nfs/data/x1/mri/orig.mgz: Stale NFS file handle", "ERROR: mri_convert failed"]
+        self.assertEqual(failures.classify(1, lines), ("transient", lines[0]))
+
+    def test_last_signature_wins(self):
+        lines = ["write failed: No space left on device", "Cannot allocate memory"]
+        self.assertEqual(failures.classify(1, lines)[0], "memory")
+
+    def test_pipeline_error(self):
+        lines = ["ERROR: Talairach failed!", "Darwin x 1 Linux", "recon-all -s x1 exited with ERRORS at Mon Jan  8 10:00:00 UTC 2024"]
+        self.assertEqual(failures.classify(1, lines), ("error", lines[2]))
+        self.assertEqual(failures.classify(2, ["done"]), ("error", "exit code 2"))
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.failure_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.failure_dir)
+
+    def record(self, kind, retries=2):
+        return failures.record(self.failure_dir, "x1", "Cross_Initialize", "--subject x1", kind, "reason", 4096, retries)
+
+    def test_record_counts_resubmitted_attempts(self):
+        failure = self.record("transient")
+        self.assertEqual((failure["attempts"], failure["retry"]), (1, True))
+        failures.mark_resubmitted(self.failure_dir, "x1", failure)
+        failure = self.record("transient")
+        self.assertEqual((failure["attempts"], failure["retry"]), (2, True))
+        failures.mark_resubmitted(self.failure_dir, "x1", failure)
+        failure = self.record("memory")
+        self.assertEqual((failure["attempts"], failure["retry"]), (3, False))
+        self.assertEqual(failures.load(self.failure_dir)["x1"], failure)
+
+    def test_record_restarts_count_after_manual_submit(self):
+        self.record("transient")
+        self.assertEqual(self.record("transient")["attempts"], 1)
+
+    def test_errors_are_not_retried(self):
+        self.assertFalse(self.record("error")["retry"])
+        self.assertFalse(self.record("transient", retries=0)["retry"])
+
+    def test_clear(self):
+        self.record("transient")
+        failures.clear(self.failure_dir, "x1")
+        self.assertEqual(failures.load(self.failure_dir), {})
+
+    def test_due(self):
+        failure = {"retry":True, "attempts":1, "failed":1000.0}
+        self.assertFalse(failures.due(failure, 1000.0 + failures.BACKOFF_SECONDS - 1))
+        self.assertTrue(failures.due(failure, 1000.0 + failures.BACKOFF_SECONDS))
+        failure["attempts"] = 3
+        self.assertFalse(failures.due(failure, 1000.0 + failures.BACKOFF_SECONDS * 3))
+        self.assertTrue(failures.due(failure, 1000.0 + failures.BACKOFF_SECONDS * 4))
+
+    def test_not_due(self):
+        self.assertFalse(failures.due({"retry":False, "attempts":1, "failed":0.0}, 1e9))
+        self.assertFalse(failures.due({"retry":True, "attempts":1, "failed":0.0, "resubmitted":1.0}, 1e9))
+
+    def test_next_memory(self):
+        self.assertEqual(failures.next_memory({"kind":"memory", "memory":"4096"}), 4096 * failures.MEMORY_FACTOR)
+        self.assertEqual(failures.next_memory({"kind":"memory", "memory":failures.MAX_MEMORY}), failures.MAX_MEMORY)
+        self.assertEqual(failures.next_memory({"kind":"transient", "memory":4096}), 4096)
+
+if __name__ == "__main__":
+    unittest.main()
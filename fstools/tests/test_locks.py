@@ -0,0 +1,80 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from fstools import locks
+
+class ClaimTest(unittest.TestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.queued = set()
+        self.cluster_queued = locks.cluster_queued
+        locks.cluster_queued = lambda cluster: cluster in self.queued
+
+    def tearDown(self):
+        locks.cluster_queued = self.cluster_queued
+        shutil.rmtree(self.lock_dir)
+
+    def age(self, path, seconds):
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_create(self):
+        path = os.path.join(self.lock_dir, "x1.job")
+        self.assertTrue(locks.create(path, {"stage":"Cross_Initialize"}))
+        self.assertFalse(locks.create(path, {"stage":"Cross_Resume"}))
+        self.assertEqual(locks.read(path), {"stage":"Cross_Initialize"})
+        self.assertEqual(os.listdir(self.lock_dir), ["x1.job"])
+
+    def test_claim_once(self):
+        self.assertEqual(locks.claim(self.lock_dir, "x1", "Cross_Initialize"), (True, None))
+        claimed, entry = locks.claim(self.lock_dir, "x1", "Cross_Resume")
+        self.assertFalse(claimed)
+        self.assertEqual(entry["stage"], "Cross_Initialize")
+        self.assertEqual(locks.claim(self.lock_dir, "x2", "Cross_Resume"), (True, None))
+
+    def test_queued_cluster(self):
+        locks.claim(self.lock_dir, "x1", "Cross_Initialize")
+        locks.set_cluster(self.lock_dir, "x1", 42)
+        self.age(locks.job_loc(self.lock_dir, "x1"), locks.SUBMIT_GRACE_SECONDS * 2)
+        self.queued.add(42)
+        self.assertEqual(locks.claim(self.lock_dir, "x1", "Cross_Resume")[1]["cluster"], 42)
+        self.queued.remove(42)
+        self.assertEqual(locks.claim(self.lock_dir, "x1", "Cross_Resume"), (True, None))
+        self.assertEqual(locks.read(locks.job_loc(self.lock_dir, "x1"))["stage"], "Cross_Resume")
+
+    def test_abandoned_submission(self):
+        locks.claim(self.lock_dir, "x1", "Cross_Initialize")
+        self.age(locks.job_loc(self.lock_dir, "x1"), locks.SUBMIT_GRACE_SECONDS * 2)
+        self.assertEqual(locks.claim(self.lock_dir, "x1", "Cross_Resume"), (True, None))
+
+    def test_running_job_holds_lease(self):
+        locks.claim(self.lock_dir, "x1", "Cross_Initialize")
+        locks.set_cluster(self.lock_dir, "x1", 42)
+        lease = locks.Lease(self.lock_dir, "x1", "Cross_Initialize")
+        self.assertTrue(lease.acquire())
+        try:
+            self.assertFalse(locks.Lease(self.lock_dir, "x1", "Cross_Resume").acquire())
+            self.assertFalse(locks.claim(self.lock_dir, "x1", "Cross_Resume")[0])
+        finally:
+            lease.release()
+        self.assertFalse(os.path.exists(locks.lease_loc(self.lock_dir, "x1")))
+        self.assertEqual(locks.claim(self.lock_dir, "x1", "Cross_Resume"), (True, None))
+
+    def test_expired_lease_taken_over(self):
+        locks.create(locks.lease_loc(self.lock_dir, "x1"), {"stage":"Cross_Initialize"})
+        self.age(locks.lease_loc(self.lock_dir, "x1"), locks.LEASE_SECONDS * 2)
+        lease = locks.Lease(self.lock_dir, "x1", "Cross_Resume")
+        self.assertTrue(lease.acquire())
+        lease.release()
+
+    def test_release_job(self):
+        locks.claim(self.lock_dir, "x1", "Cross_Initialize")
+        locks.release_job(self.lock_dir, "x1", "Cross_Resume")
+        self.assertTrue(os.path.exists(locks.job_loc(self.lock_dir, "x1")))
+        locks.release_job(self.lock_dir, "x1", "Cross_Initialize")
+        self.assertFalse(os.path.exists(locks.job_loc(self.lock_dir, "x1")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# setupfreesurfer and palantir are Python 2 only.
+if sys.version_info[0] == 2:
+    import setupfreesurfer
+    from palantir import palantir
+else:
+    setupfreesurfer = None
+
+@unittest.skipIf(setupfreesurfer == None, "requires Python 2")
+class CreateMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.project = setupfreesurfer.Project(None, self.temp_dir + "/data", self.temp_dir + "/code", self.temp_dir + "/freesurfer")
+        os.makedirs(self.project.script_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def columns(self):
+        return [column["id"] for column in palantir.read_json(self.project.monitor_dir + "data/structure.json")["cols"]]
+
+    def cell_exists(self, row, column):
+        return os.path.exists(os.path.join(self.project.monitor_dir, "data", "{0}-{1}.json".format(row, column)))
+
+    def legacy_monitor(self, columns):
+        """A dashboard as setup left it before it kept project.json, with a column added by hand."""
+        palantir.create(self.project.monitor_dir, self.project.name)
+        palantir.update(self.project.monitor_dir, add_rows=["Project", "s1"], add_columns=columns + ["Notes"])
+        palantir.cell(self.project.monitor_dir, row_id="s1", column_id="Notes", text="Check the skull strip")
+        palantir.cell(self.project.monitor_dir, row_id="Project", column_id="Notes", text="Batch 2")
+
+    def test_legacy_project_keeps_hand_added_columns(self):
+        self.legacy_monitor(["View", "Extract", "Cross_Initialize", "Cross_Restart", "Base_Initialize"])
+        self.project.create_monitor()
+        columns = self.columns()
+        self.assertIn("Notes", columns)
+        self.assertTrue(self.cell_exists("s1", "Notes"))
+        self.assertTrue(self.cell_exists("Project", "Notes"))
+        self.assertNotIn("Base_Initialize", columns)
+        self.assertEqual(sorted(set(self.project.columns()) - set(columns)), [])
+
+    def test_rerun_removes_only_generated_columns(self):
+        self.legacy_monitor(["View", "Extract"])
+        self.project.create_monitor()
+        self.project.is_longitudinal = True
+        self.project.scripts.append(setupfreesurfer.Script("Base_Initialize", flags=["config", "subject"]))
+        self.project.create_monitor()
+        self.assertIn("Base_Initialize", self.columns())
+        self.project.scripts.pop()
+        self.project.create_monitor()
+        self.assertNotIn("Base_Initialize", self.columns())
+        self.assertIn("Notes", self.columns())
+        self.assertTrue(self.cell_exists("s1", "Notes"))
+
+if __name__ == "__main__":
+    unittest.main()
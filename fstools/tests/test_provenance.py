@@ -0,0 +1,75 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from fstools import provenance
+
+CROSS = ["s1_1", "s1_2"]
+BASE = "s1_base"
+LONGS = ["s1_1.long.s1_base", "s1_2.long.s1_base"]
+
+class StaleTest(unittest.TestCase):
+    def setUp(self):
+        self.subjects_dir = tempfile.mkdtemp()
+        self.now = time.time()
+        for offset, fs_id in enumerate(CROSS + [BASE] + LONGS):
+            self.finish(fs_id, self.now - 1000 + offset * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.subjects_dir)
+
+    def finish(self, fs_id, mtime):
+        scripts = os.path.join(self.subjects_dir, fs_id, "scripts")
+        if not os.path.isdir(scripts):
+            os.makedirs(scripts)
+        done_loc = os.path.join(scripts, "recon-all.done")
+        with open(done_loc, "a"):
+            pass
+        os.utime(done_loc, (mtime, mtime))
+
+    def record_all(self):
+        statuses = self.statuses()
+        for fs_id in [BASE] + LONGS:
+            provenance.record(self.subjects_dir, fs_id, provenance.inputs(fs_id, statuses))
+
+    def statuses(self, *extra):
+        return dict((fs_id, "Finished") for fs_id in CROSS + [BASE] + LONGS + list(extra))
+
+    def test_inputs(self):
+        statuses = self.statuses("s10_1", "s10_base")
+        self.assertEqual(provenance.inputs(BASE, statuses), CROSS)
+        self.assertEqual(provenance.inputs(LONGS[1], statuses), ["s1_2", BASE])
+        self.assertEqual(provenance.inputs("s1_1", statuses), [])
+
+    def test_nothing_changed(self):
+        self.record_all()
+        self.assertEqual(provenance.stale(self.subjects_dir, self.statuses(), workers=1), {})
+
+    def test_rerun_cross_makes_base_and_longs_stale(self):
+        self.record_all()
+        self.finish("s1_1", self.now)
+        self.assertEqual(provenance.stale(self.subjects_dir, self.statuses(), workers=1), {
+            BASE: ["s1_1"], LONGS[0]: ["s1_1", BASE], LONGS[1]: [BASE]})
+
+    def test_new_timepoint(self):
+        self.record_all()
+        self.finish("s1_3", self.now - 2000)
+        self.assertEqual(provenance.stale(self.subjects_dir, self.statuses("s1_3"), workers=1), {
+            BASE: ["s1_3"], LONGS[0]: [BASE], LONGS[1]: [BASE]})
+
+    def test_unfinished_inputs_ignored(self):
+        self.record_all()
+        self.finish("s1_1", self.now)
+        statuses = self.statuses()
+        statuses["s1_1"] = "Running"
+        self.assertEqual(provenance.stale(self.subjects_dir, statuses, workers=1), {})
+
+    def test_without_provenance(self):
+        self.assertEqual(provenance.stale(self.subjects_dir, self.statuses(), workers=1), {})
+        self.finish("s1_2", self.now)
+        self.assertEqual(provenance.stale(self.subjects_dir, self.statuses(), workers=1), {
+            BASE: ["s1_2"], LONGS[0]: [BASE], LONGS[1]: ["s1_2", BASE]})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fstools import qc
+from fstools import columnar
+
+@unittest.skipIf(qc.numpy == None, "requires numpy")
+class RobustZTest(unittest.TestCase):
+    def test_scores(self):
+        values = qc.numpy.array([[1.0], [2.0], [3.0], [4.0], [100.0]])
+        scores = qc.robust_z(values)
+        # Median 3, MAD 1.
+        self.assertAlmostEqual(scores[0, 0], -2 * qc.MAD_SCALE)
+        self.assertAlmostEqual(scores[2, 0], 0.0)
+        self.assertAlmostEqual(scores[4, 0], 97 * qc.MAD_SCALE)
+
+    def test_missing_and_constant_columns(self):
+        nan = qc.numpy.nan
+        values = qc.numpy.array([[5.0, 1.0], [5.0, nan], [5.0, 3.0], [5.0, 2.0]])
+        scores = qc.robust_z(values)
+        self.assertEqual(scores[:, 0].tolist(), [0.0, 0.0, 0.0, 0.0])
+        self.assertEqual(scores[1, 1], 0.0)
+        self.assertAlmostEqual(scores[2, 1], qc.MAD_SCALE)
+
+    def test_outliers_ranked_first(self):
+        values = qc.numpy.array([[1.0], [2.0], [3.0], [4.0], [100.0]])
+        rows = qc.outliers(["a", "b", "c", "d", "e"], ["aseg-volume Left-Hippocampus"], values)
+        self.assertEqual(rows[0][:3], ("e", 1, "aseg-volume Left-Hippocampus"))
+        self.assertEqual([row[1] for row in rows[1:]], [0, 0, 0, 0])
+
+@unittest.skipIf(qc.numpy == None, "requires numpy")
+class LoadMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_global_measures_only_from_aseg(self):
+        records = [
+            {"id":"a", "tables":{"lh_aparc-desikankilliany-thickness":[["lh_bankssts_thickness", 2.4], ["BrainSegVolNotVent", 1.1e6], ["eTIV", 1.5e6]],
+                                 "lh_aparc-desikankilliany-area":[["lh_bankssts_area", 980.0]],
+                                 "aseg-volume":[["BrainSegVolNotVent", 1.1e6], ["EstimatedTotalIntraCranialVol", 1.5e6]]}},
+            {"id":"b", "tables":{"lh_aparc-desikankilliany-thickness":[["lh_bankssts_thickness", 2.1], ["BrainSegVolNotVent", 1.2e6], ["eTIV", 1.6e6]],
+                                 "aseg-volume":[["BrainSegVolNotVent", 1.2e6]]}},
+        ]
+        matrix_dir = columnar.write_matrices(records, os.path.join(self.temp_dir, columnar.MATRIX_DIR))
+        subjects, labels, values = qc.load_matrix(matrix_dir)
+        self.assertEqual(subjects, ["a", "b"])
+        self.assertEqual(labels, ["aseg-volume BrainSegVolNotVent", "aseg-volume EstimatedTotalIntraCranialVol", "lh_aparc-desikankilliany-thickness lh_bankssts_thickness"])
+        self.assertEqual(values[0].tolist(), [1.1e6, 1.5e6, 2.4])
+        self.assertEqual(values[1, [0, 2]].tolist(), [1.2e6, 2.1])
+        self.assertTrue(qc.numpy.isnan(values[1, 1]))
+
+    def test_matrices_can_be_mapped(self):
+        matrix_dir = columnar.write_matrices([{"id":"a", "tables":{"aseg-volume":[["Left-Hippocampus", 4211.9]]}}], os.path.join(self.temp_dir, columnar.MATRIX_DIR))
+        mapped = qc.numpy.load(os.path.join(matrix_dir, "aseg-volume.npy"), mmap_mode="r")
+        self.assertIsInstance(mapped, qc.numpy.memmap)
+        self.assertEqual(mapped.tolist(), [[4211.9]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from fstools import resume
+
+class EntryPointTest(unittest.TestCase):
+    def setUp(self):
+        self.subject_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.subject_path, "scripts"))
+
+    def tearDown(self):
+        shutil.rmtree(self.subject_path)
+
+    def touch(self, name, mtime=None):
+        path = os.path.join(self.subject_path, name)
+        with open(path, "a"):
+            pass
+        if mtime != None:
+            os.utime(path, (mtime, mtime))
+
+    def log_steps(self, *steps):
+        with open(os.path.join(self.subject_path, "scripts", "recon-all-status.log"), "a") as status_file:
+            for step in steps:
+                status_file.write("#@# {0} Mon Jan  8 10:00:00 UTC 2024\n".format(step))
+
+    def test_not_started(self):
+        self.assertEqual(resume.entry_point(self.subject_path), (["-all"], None))
+        self.assertFalse(resume.imported(self.subject_path))
+
+    def test_interrupted_in_autorecon1(self):
+        self.log_steps("MotionCor", "Talairach", "Skull Stripping")
+        self.assertEqual(resume.entry_point(self.subject_path), (["-all"], "Skull Stripping"))
+
+    def test_interrupted_at_entry_point(self):
+        self.log_steps("MotionCor", "EM Registration")
+        self.assertEqual(resume.entry_point(self.subject_path), (["-autorecon2", "-autorecon3"], "EM Registration"))
+
+    def test_interrupted_between_entry_points(self):
+        self.log_steps("MotionCor", "EM Registration", "Intensity Normalization2", "Mask BFS", "WM Segmentation")
+        self.assertEqual(resume.entry_point(self.subject_path), (["-autorecon2-cp", "-autorecon3"], "WM Segmentation"))
+
+    def test_hemisphere_steps(self):
+        self.log_steps("Fill", "Tessellate lh", "Curvature Stats rh", "Surf Reg lh")
+        self.assertEqual(resume.entry_point(self.subject_path), (["-autorecon3"], "Surf Reg"))
+
+    def test_finished(self):
+        self.log_steps("MotionCor", "BA_exvivo Labels")
+        now = time.time()
+        os.utime(os.path.join(self.subject_path, "scripts", "recon-all-status.log"), (now - 60, now - 60))
+        self.touch(os.path.join("scripts", "recon-all.done"), now)
+        self.assertEqual(resume.entry_point(self.subject_path), ([], None))
+
+    def test_rerun_after_finishing(self):
+        now = time.time()
+        self.touch(os.path.join("scripts", "recon-all.done"), now - 60)
+        self.log_steps("Fill")
+        os.utime(os.path.join(self.subject_path, "scripts", "recon-all-status.log"), (now, now))
+        self.assertEqual(resume.entry_point(self.subject_path), (["-autorecon2-wm", "-autorecon3"], "Fill"))
+
+    def test_imported(self):
+        os.makedirs(os.path.join(self.subject_path, "mri", "orig"))
+        self.assertFalse(resume.imported(self.subject_path))
+        self.touch(os.path.join("mri", "orig", "001.mgz"))
+        self.assertTrue(resume.imported(self.subject_path))
+
+    def test_imported_once_a_step_started(self):
+        self.log_steps("MotionCor")
+        self.assertTrue(resume.imported(self.subject_path))
+
+if __name__ == "__main__":
+    unittest.main()
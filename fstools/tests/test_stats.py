@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fstools import stats
+from fstools import columnar
+
+APARC = """# Title Cortical Parcellation Statistics
+# Measure Cortex, NumVert, Number of Vertices, 118630, unitless
+# Measure Cortex, WhiteSurfArea, White Surface Total Area, 81722.3, mm^2
+# Measure Cortex, MeanThickness, Mean Thickness, 2.56087, mm
+# Measure BrainSegNotVent, BrainSegVolNotVent, Brain Segmentation Volume Without Ventricles, 1100000.0, mm^3
+# Measure EstimatedTotalIntraCranialVol, eTIV, Estimated Total Intracranial Volume, 1500000.123456, mm^3
+# ColHeaders StructName NumVert SurfArea GrayVol ThickAvg ThickStd MeanCurv GausCurv FoldInd CurvInd
+bankssts 1422 980 2356 2.420 0.551 0.110 0.024 10 1.4
+superiorfrontal 11830 7898 25671 2.853 0.598 0.126 0.025 122 12.0
+"""
+
+ASEG = """# Title Segmentation Statistics
+# Measure BrainSeg, BrainSegVol, Brain Segmentation Volume, 1200000.0, mm^3
+# Measure EstimatedTotalIntraCranialVol, eTIV, Estimated Total Intracranial Volume, 1500000.123456, mm^3
+# ColHeaders  Index SegId NVoxels Volume_mm3 StructName normMean normStdDev normMin normMax normRange
+  1   4     7321     7415.3  Left-Lateral-Ventricle     35.0     11.5    11.0    86.0    75.0
+  2  17     4190     4211.9  Left-Hippocampus           76.2      9.4    37.0   108.0    71.0
+"""
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        self.subjects_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.subjects_dir, "x1", "stats"))
+        self.write("lh.aparc.stats", APARC)
+        self.write("aseg.stats", ASEG)
+
+    def tearDown(self):
+        shutil.rmtree(self.subjects_dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.subjects_dir, "x1", "stats", name), "w") as stats_file:
+            stats_file.write(text)
+
+    def test_read_stats(self):
+        measures, rows = stats.read_stats(os.path.join(self.subjects_dir, "x1", "stats", "lh.aparc.stats"))
+        self.assertEqual(measures[2], ("MeanThickness", 2.56087))
+        self.assertEqual(measures[4], ("eTIV", 1500000.123456))
+        self.assertEqual([row["StructName"] for row in rows], ["bankssts", "superiorfrontal"])
+        self.assertEqual(rows[0]["ThickAvg"], "2.420")
+
+    def test_aparc_columns(self):
+        tables = stats.parse_subject((self.subjects_dir, "x1"))["tables"]
+        self.assertEqual(tables["lh_aparc-desikankilliany-thickness"], [
+            ["lh_bankssts_thickness", 2.42], ["lh_superiorfrontal_thickness", 2.853], ["lh_MeanThickness_thickness", 2.56087],
+            ["BrainSegVolNotVent", 1100000.0], ["eTIV", 1500000.123456]])
+        self.assertEqual(tables["lh_aparc-desikankilliany-area"][:3], [
+            ["lh_bankssts_area", 980.0], ["lh_superiorfrontal_area", 7898.0], ["lh_WhiteSurfArea_area", 81722.3]])
+        self.assertEqual(tables["lh_aparc-desikankilliany-meancurv"][:2], [["lh_bankssts_meancurv", 0.11], ["lh_superiorfrontal_meancurv", 0.126]])
+
+    def test_aseg_columns(self):
+        tables = stats.parse_subject((self.subjects_dir, "x1"))["tables"]
+        self.assertEqual(tables["aseg-volume"], [
+            ["Left-Lateral-Ventricle", 7415.3], ["Left-Hippocampus", 4211.9],
+            ["BrainSegVol", 1200000.0], ["EstimatedTotalIntraCranialVol", 1500000.123456]])
+
+    def test_missing_files(self):
+        record = stats.parse_subject((self.subjects_dir, "x1"))
+        self.assertEqual(sorted(os.path.basename(path) for path in record["missing"]), ["lh.aparc.a2009s.stats", "rh.aparc.a2009s.stats", "rh.aparc.stats"])
+        self.assertNotIn("rh_aparc-desikankilliany-thickness", record["tables"])
+
+    def test_table_header(self):
+        self.assertEqual(stats.table_header("rh_aparc-destrieux-meancurv"), "rh.aparc.a2009s.meancurv")
+        self.assertEqual(stats.table_header("aseg-volume"), "Measure:volume")
+        self.assertEqual(len(stats.table_names()), 2 * 2 * len(stats.MEASURES) + 1)
+
+    def test_region_of(self):
+        self.assertEqual(columnar.region_of("lh_bankssts_thickness", "lh", "thickness"), "bankssts")
+        self.assertEqual(columnar.region_of("rh_WhiteSurfArea_area", "rh", "area"), "WhiteSurfArea")
+        self.assertEqual(columnar.region_of("Left-Hippocampus", None, "volume"), "Left-Hippocampus")
+
+    def test_long_rows_give_global_measures_once(self):
+        rows = list(columnar.long_rows([stats.parse_subject((self.subjects_dir, "x1"))]))
+        etiv = [row for row in rows if row[5] in ["eTIV", "EstimatedTotalIntraCranialVol"]]
+        self.assertEqual(etiv, [("x1", "aseg-volume", "", "aseg", "volume", "EstimatedTotalIntraCranialVol", 1500000.123456)])
+        self.assertFalse([row for row in rows if row[5] == "BrainSegVolNotVent"])
+
+if __name__ == "__main__":
+    unittest.main()
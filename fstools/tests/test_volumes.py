@@ -0,0 +1,39 @@
+import os
+import gzip
+import struct
+import shutil
+import tempfile
+import unittest
+from fstools import volumes
+
+LUT = [(0, "Unknown"), (2, "Left-Cerebral-White-Matter"), (17, "Left-Hippocampus"), (53, "Right-Hippocampus")]
+
+@unittest.skipIf(volumes.numpy == None, "requires numpy")
+class LabelVolumesTest(unittest.TestCase):
+    def setUp(self):
+        self.subjects_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.subjects_dir)
+
+    def write_mgz(self, fs_id, labels, voxel_size):
+        """A 1 x 1 x len(labels) uchar volume."""
+        os.makedirs(os.path.join(self.subjects_dir, fs_id, "mri"))
+        header = struct.pack(">7ih3f", 1, 1, 1, len(labels), 1, 0, 0, 1, voxel_size, voxel_size, voxel_size)
+        with gzip.open(os.path.join(self.subjects_dir, fs_id, "mri", "aseg.mgz"), "wb") as volume_file:
+            volume_file.write(header + b"\0" * (volumes.MGH_HEADER_SIZE - len(header)) + struct.pack(">{0}B".format(len(labels)), *labels))
+
+    def test_counts_and_volumes(self):
+        self.write_mgz("x1", [0, 0, 2, 2, 2, 17], 2.0)
+        self.write_mgz("x2", [0, 17, 17], 1.0)
+        records = volumes.label_volumes(self.subjects_dir, ["x1", "x2", "x3"], "aseg", LUT, workers=1)
+        self.assertEqual(records[0]["tables"], {
+            "aseg-bincount-nvoxels": [["Left-Cerebral-White-Matter", 3], ["Left-Hippocampus", 1]],
+            "aseg-bincount-volume": [["Left-Cerebral-White-Matter", 24.0], ["Left-Hippocampus", 8.0]]})
+        self.assertEqual(records[1]["tables"]["aseg-bincount-nvoxels"], [["Left-Cerebral-White-Matter", 0], ["Left-Hippocampus", 2]])
+        self.assertEqual(records[1]["tables"]["aseg-bincount-volume"], [["Left-Cerebral-White-Matter", 0.0], ["Left-Hippocampus", 2.0]])
+        self.assertEqual(records[2]["tables"], {})
+        self.assertEqual(records[2]["missing"], [os.path.join(self.subjects_dir, "x3", "mri", "aseg.mgz")])
+
+if __name__ == "__main__":
+    unittest.main()
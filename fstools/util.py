@@ -0,0 +1,86 @@
+import os
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class _Entry(object):
+    """Minimal stand-in for os.DirEntry when scandir is not available."""
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def list_dir(path):
+    """List the entries of a directory, preferring scandir so type checks need no extra stat calls."""
+    if scandir != None:
+        return list(scandir(path))
+    return [_Entry(path, name) for name in os.listdir(path)]
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as json_file:
+        return json.load(json_file)
+
+def write_json(path, data):
+    """Write json through a temporary file and rename, so readers never see a partial file."""
+    makedirs(os.path.dirname(path))
+    temp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp, "w") as json_file:
+        json.dump(data, json_file, sort_keys=True)
+    os.rename(temp, path)
+
+def pool_map(function, items, workers=8, processes=False):
+    """Map over items with a thread pool (I/O bound work) or a process pool (parsing)."""
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    if processes:
+        pool = multiprocessing.Pool(min(workers, len(items)))
+    else:
+        pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def pool_imap(function, items, workers=8):
+    """Like pool_map with threads, but yields results in order as they complete, keeping few in memory."""
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        for result in pool.imap(function, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
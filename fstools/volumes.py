@@ -0,0 +1,81 @@
+import os
+import gzip
+import struct
+from fstools import util
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# MGH voxel types: FreeSurfer type code -> big-endian numpy dtype
+MGH_TYPES = {0:">u1", 1:">i4", 3:">f4", 4:">i2"}
+MGH_HEADER_SIZE = 284
+
+def read_mgh(path):
+    """
+    Read a .mgh/.mgz volume without nibabel.
+    Returns (data as a flat array of the first frame, voxel volume in mm^3).
+    """
+    opener = gzip.open if path.endswith(".mgz") else open
+    with opener(path, "rb") as volume_file:
+        raw = volume_file.read()
+    version, width, height, depth, frames, voxel_type, dof = struct.unpack(">7i", raw[:28])
+    good_ras = struct.unpack(">h", raw[28:30])[0]
+    sizes = struct.unpack(">3f", raw[30:42]) if good_ras > 0 else (1.0, 1.0, 1.0)
+    if voxel_type not in MGH_TYPES:
+        raise IOError("Unsupported MGH voxel type {0} in '{1}'".format(voxel_type, path))
+    count = width * height * depth
+    data = numpy.frombuffer(raw, dtype=MGH_TYPES[voxel_type], count=count, offset=MGH_HEADER_SIZE)
+    # Voxel sizes are stored as float32; round away the representation error.
+    return data, round(float(sizes[0]) * float(sizes[1]) * float(sizes[2]), 6)
+
+def read_lut(path):
+    """Label lookup table (FreeSurferColorLUT.txt format) as an ordered list of (label, name)."""
+    labels = []
+    with open(path, "r") as lut_file:
+        for line in lut_file:
+            fields = line.split()
+            if len(fields) >= 2 and not fields[0].startswith("#") and fields[0].isdigit():
+                labels.append((int(fields[0]), fields[1]))
+    return labels
+
+def count_labels(item):
+    """
+    Load one segmentation and count every label with a single bincount.
+    Returns (fs_id, {label: number of voxels}, voxel volume in mm^3), or (fs_id, None, None) if the volume is missing.
+    """
+    subjects_dir, fs_id, segmentation = item
+    path = os.path.join(subjects_dir, fs_id, "mri", segmentation + ".mgz")
+    if not os.path.exists(path):
+        return fs_id, None, None
+    data, voxel_volume = read_mgh(path)
+    counts = numpy.bincount(data.astype(numpy.int64).ravel())
+    present = numpy.nonzero(counts)[0]
+    return fs_id, dict((int(label), int(counts[label])) for label in present), voxel_volume
+
+def label_volumes(subjects_dir, fs_ids, segmentation, lut, workers=8):
+    """
+    Voxel counts and volumes of every lookup-table label in segmentation (e.g. 'aseg' or 'aparc+aseg')
+    for fs_ids, computed across a process pool. Returns records in the extraction record format, with an
+    nvoxels and a volume table; columns are the labels present in at least one subject.
+    """
+    results = util.pool_map(count_labels, [(subjects_dir, fs_id, segmentation) for fs_id in fs_ids], workers=workers, processes=True)
+    observed = set()
+    for fs_id, counts, voxel_volume in results:
+        observed.update(counts or {})
+    # Label 0 is background, which asegstats2table does not report either.
+    labels = [(label, name) for label, name in lut if label in observed and label != 0]
+    records = []
+    for fs_id, counts, voxel_volume in results:
+        record = {"id":fs_id, "tables":{}, "missing":[]}
+        if counts == None:
+            record["missing"].append(os.path.join(subjects_dir, fs_id, "mri", segmentation + ".mgz"))
+        else:
+            record["tables"][table_name(segmentation, "nvoxels")] = [[label_name, counts.get(label, 0)] for label, label_name in labels]
+            record["tables"][table_name(segmentation)] = [[label_name, counts.get(label, 0) * voxel_volume] for label, label_name in labels]
+        records.append(record)
+    return records
+
+def table_name(segmentation, measure="volume"):
+    return "{0}-bincount-{1}".format(segmentation, measure)
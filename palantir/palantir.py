@@ -283,6 +283,31 @@ def cell(dirpath, row_id, column_id, text=None, background_color=None, text_colo
     root = cleaned_path(dirpath)
     update_json(root+"/data/{0}-{1}.json".format(row_id, column_id), callback=cell_updater, root=root, row_id=row_id, column_id=column_id, text=text, background_color=background_color, text_color=text_color, boolean=boolean, animation=animation, add_image=add_image, remove_image=remove_image, add_note=add_note)
 
+def cells(dirpath, updates):
+    """
+    cells : update many cells in one call
+    ----------------
+
+    #usage:
+    `cells(dirpath, updates)`
+    dirpath: Specify the path to the dashboard directory.
+    updates: list of dicts, each holding row_id, column_id and any of the optional cell() arguments.
+    Cells that do not exist, or that the update would not change, are skipped.
+    Returns the number of cells written.
+    """
+    root = cleaned_path(dirpath)
+    written = 0
+    for update in updates:
+        path = root+"/data/{0}-{1}.json".format(update["row_id"], update["column_id"])
+        if not os.path.exists(path):
+            continue
+        current = read_json(path)
+        newdata = cell_updater(current, root, **update)
+        if newdata != current:
+            write_json(path, newdata)
+            written += 1
+    return written
+
 def query(dirpath, row_id=None, column_id=None, field=None):
     print()
 
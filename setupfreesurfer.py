@@ -6,15 +6,99 @@ import subprocess
 import math
 import socket
 import string
+import time
+import json
+import csv
+import re
 from docopt.docopt import docopt
 from palantir import palantir
+from fstools import dashboard
+from fstools import scan
+from fstools import progress
+from fstools import runtimes
+from fstools import extract
+from fstools import columnar
+from fstools import volumes
+from fstools import overlays
+from fstools import statsdb
+from fstools import qc
+from fstools import defects
+from fstools import fscache
+from fstools import resume
+from fstools import edits
+from fstools import provenance
+from fstools import locks
+from fstools import job
+from fstools import failures
 
 Version = "0.2"
 doc = """
 Setup FreeSurfer.
 
 Usage:
-  setupfreesurfer [options] (--data_dir <dir> | -d <dir>) (--code_dir <dir> | -c <dir>) [(--freesurfer_home <dir> | -f <dir>)] [(--name <str> | -n <str>)] [--host <host>]
+  setupfreesurfer [options] [--longitudinal] (--data_dir <dir> | -d <dir>) (--code_dir <dir> | -c <dir>) [(--freesurfer_home <dir> | -f <dir>)] [(--name <str> | -n <str>)] [--host <host>]
+  setupfreesurfer register (--code_dir <dir> | -c <dir>) <manifest>
+  setupfreesurfer status (--code_dir <dir> | -c <dir>) [--workers <n>] [--sync]
+  setupfreesurfer monitor (--code_dir <dir> | -c <dir>) [--workers <n>] [--interval <s>] [--once]
+  setupfreesurfer runtimes (--code_dir <dir> | -c <dir>) [--workers <n>]
+  setupfreesurfer extract (--code_dir <dir> | -c <dir>) [--subjectlist <file>] [--workers <n>] [--hash] [--partial <file>] [--longitudinal]
+  setupfreesurfer shard (--code_dir <dir> | -c <dir>) [--subjectlist <file>] [--shardsize <n>]
+  setupfreesurfer merge (--code_dir <dir> | -c <dir>)
+  setupfreesurfer volumes (--code_dir <dir> | -c <dir>) [--subjectlist <file>] [--workers <n>] [--lut <file>] [--segmentation <name>...]
+  setupfreesurfer wholebrain (--code_dir <dir> | -c <dir>) [--subjectlist <file>] [--workers <n>] [--overlay <path>] [--hemi <hemi>...]
+  setupfreesurfer qc (--code_dir <dir> | -c <dir>) [--threshold <z>]
+  setupfreesurfer defects (--code_dir <dir> | -c <dir>) [--workers <n>]
+  setupfreesurfer rerun (--code_dir <dir> | -c <dir>) [--subjectlist <file>] [--workers <n>] [--dry_run] [<fs_id>...]
+  setupfreesurfer invalidate (--code_dir <dir> | -c <dir>) [--workers <n>] [--dry_run]
+  setupfreesurfer submit (--code_dir <dir> | -c <dir>) <stage> --subject <id> [--timepoint <tp>] [--] <command>...
+  setupfreesurfer retry (--code_dir <dir> | -c <dir>) [--dry_run]
+  setupfreesurfer batch (--code_dir <dir> | -c <dir>) [--] <command>...
+  setupfreesurfer freesurfer_home (--code_dir <dir> | -c <dir>)
+
+Commands:
+  register     Add every subject in a manifest csv (subject,timepoint,input columns) to the
+               dashboard in one operation, to be submitted by scripts/Cross_Initialize_batch.sh.
+  status       Scan SUBJECTS_DIR for finished, failed and running subjects.
+  monitor      Keep the dashboard status columns current, showing the recon-all step, time left
+               for running subjects and the cohort ETA.
+  runtimes     Read the step timings of every subject into cache/runtimes.db and summarize them.
+  extract      Write the aparc and aseg stats tables to ANALYSIS_DIR/extracted, reading each stats file once.
+               Without --subjectlist, every finished subject is extracted. Parsed subjects are cached
+               in ANALYSIS_DIR/cache, and only new or changed stats files are parsed again. The values are
+               also kept in the indexed database ANALYSIS_DIR/stats.db.
+               With --longitudinal, the finished .long. directories of every (registered) timepoint are
+               extracted to ANALYSIS_DIR/extracted/long, and --subjectlist lists subject ids.
+  shard        Split the subjects into shards and write the Extract_Sharded DAG (used by scripts/Extract_Sharded.sh).
+  merge        Merge the partial tables of every shard into ANALYSIS_DIR/extracted (the DAG's reduce job).
+  volumes      Count the voxels of every lookup table label in each subject's segmentation volumes
+               (aseg and aparc+aseg by default) and write <segmentation>-bincount-nvoxels-table.csv and
+               <segmentation>-bincount-volume-table.csv tables to ANALYSIS_DIR/extracted. Requires numpy.
+  wholebrain   Stack each subject's surface overlay (curv format, or .mgh/.mgz) as a row of a float32 matrix
+               in ANALYSIS_DIR/wholebrain/<overlay>.f32, indexed by <overlay>.subjects.txt. Subjects already
+               stacked are skipped, so new subjects are appended without rebuilding. Requires numpy.
+  qc           Score every extracted volume and thickness against the cohort with robust z-scores, write
+               ANALYSIS_DIR/extracted/qc-outliers.csv (most outlying subjects first) and mark the QC column
+               of every subject on the dashboard. Run after extract. Requires numpy.
+  defects      Read the Euler numbers and holes of the surfaces before topology correction from every
+               recon-all.log (only the part written since the last pass), write them to
+               ANALYSIS_DIR/extracted/euler-table.csv and to the Euler dashboard column.
+  rerun        Find the subjects whose editable files (talairach.xfm, brainmask.mgz, control.dat, wm.mgz,
+               brain.finalsurfs.manedit.mgz) changed since their last run, and submit the cheapest rerun
+               stage that includes every edit. Without subject ids or --subjectlist, every subject is checked.
+  invalidate   Mark the bases and longs built from a cross (or base) that has been rerun since as Stale on the
+               dashboard, and submit a DAG that reruns only those, each base before the longs built on it.
+  submit       Run a stage's condor_submit <command> unless a job is already queued or running on the same
+               subject: a duplicate of the same stage is coalesced, and any other stage is refused.
+               Used by the generated stage scripts.
+  retry        Resubmit the jobs that failed from running out of memory (with more memory) or from a transient
+               error (NFS, I/O, full scratch), once their backoff has passed, and list the failures that need
+               review. monitor does this on every pass.
+  batch        Claim every registered session without a subject directory that is not already queued or
+               running, write them to the Cross_Initialize queue and run condor_submit <command> on it.
+               Used by scripts/Cross_Initialize_batch.sh.
+  freesurfer_home
+               Print the FREESURFER_HOME jobs on this node run from: the node-local copy (made first if needed)
+               with --local_freesurfer, else the shared install. Used by executables/View.sh.
 
 Options:
   -h --help                             Show this screen.
@@ -26,8 +110,45 @@ Options:
   -f <dir> --freesurfer_home <dir>      By default, FREESURFER_HOME env variable. Specify otherwise if needed. [default: None]
   --host <host>                         Optional. Require running from a specific host.
                                         Specify "current" to use the current host. [default: None]
+  --scratch <dir>                       Optional. Run recon-all on a copy of the subject in this node-local
+                                        directory, e.g. '$_CONDOR_SCRATCH_DIR'. [default: None]
+  --local_freesurfer <dir>              Optional. Copy FREESURFER_HOME to this node-local directory on first use,
+                                        and run FreeSurfer from there. [default: None]
+  --workers <n>                         Number of parallel workers. [default: 8]
+  --sync                                Also write the results into the dashboard. (status)
+  --interval <s>                        Seconds between monitor passes. [default: 60]
+  --once                                Make a single monitor pass and exit. (monitor)
+  --subjectlist <file>                  File listing the subject ids to use. (extract)
+  --hash                                Also compare stats file contents, not just size and mtime. (extract)
+  --partial <file>                      Write the parsed subjects to a partial file instead of the tables. (extract)
+  --shardsize <n>                       Number of subjects per map job. [default: 200]
+  --lut <file>                          Label lookup table. By default, FreeSurferColorLUT.txt in FREESURFER_HOME. (volumes)
+  --segmentation <name>...              Segmentation volumes in mri/ to measure, without .mgz. (volumes)
+  --overlay <path>                      Overlay path within each subject, with {hemi} for the hemisphere.
+                                        [default: surf/{hemi}.thickness.fwhm10.fsaverage.mgh]
+  --hemi <hemi>...                      Hemispheres to stack. By default, lh and rh. (wholebrain)
+  --threshold <z>                       Robust z-score beyond which a value is an outlier. [default: 3.5]
+  --dry_run                             Only print the reruns that would be submitted. (rerun, invalidate, retry)
+  --subject <id>                        Subject of the job. (submit)
+  --timepoint <tp>                      Timepoint of the job, for cross and long stages. (submit)
 """
 
+# recon-all flags of each stage, shared by the Cross, Base and Long phases.
+RECON_STAGES = ["Initialize", "Restart", "talRerun", "maskRerun", "cpRerun", "wmRerun", "gmRerun", "Resume"]
+RECON_FLAGS = {
+    "Initialize": ["-all"],
+    "Restart": ["-clean", "-all"],
+    "talRerun": ["-all"],
+    "maskRerun": ["-autorecon2", "-autorecon3"],
+    "cpRerun": ["-autorecon2-cp", "-autorecon3"],
+    "wmRerun": ["-autorecon2-wm", "-autorecon3"],
+    "gmRerun": ["-autorecon-pial"],
+    # Chosen when the job starts, from where recon-all-status.log stops.
+    "Resume": [],
+}
+# Dashboard columns of projects set up before project.json recorded which columns setup added.
+LEGACY_COLUMNS = ["View", "Extract"] + [phase+"_"+stage for phase in ["Cross", "Base", "Long"] for stage in RECON_STAGES if stage != "Resume"]
+
 #------------------------------------
 #    Utility
 #------------------------------------
@@ -46,6 +167,12 @@ def clean_path(path):
 def exists(path):
     return os.path.exists(os.path.realpath(os.path.expanduser(path)))
 
+def shell_escape(value):
+    """Escape value for use inside double quotes in a shell script."""
+    for character in ["\\", '"', "$", "`"]:
+        value = value.replace(character, "\\" + character)
+    return value
+
 def system_call(command):
   p = subprocess.Popen(command.split(" "), stdout=subprocess.PIPE, shell=False)
   return p.stdout.read()
@@ -57,10 +184,14 @@ def load_file(path):
     return text
 
 def write_file(path, content, is_executable=False):
+    """Write content to path, leaving the file untouched if it is already current. Returns True if written."""
+    if exists(path) and load_file(path) == content:
+        return False
     with open(clean_path(path), "w") as text_file:
         text_file.write(content)
     if is_executable:
         os.chmod(path, os.stat(path).st_mode | 0111)
+    return True
 
 
 class Project(object):
@@ -74,18 +205,25 @@ class Project(object):
         analysis_dir
         code_dir
         freesurfer_home
+        scratch_root
+        freesurfer_cache
         scripts
         dirs
         script_template
         submit_template
+        state_loc
 
     Methods:
         create_directories
+        columns
+        load_state
+        save_state
         write_scripts
         write_submits
         create_monitor
     """
-    def __init__(self, name, data_dir, code_dir, freesurfer_home, is_longitudinal=False, host=None):
+    def __init__(self, name, data_dir, code_dir, freesurfer_home, is_longitudinal=False, host=None, scratch_root=None, freesurfer_cache=None):
+        self.settings = {"name":name, "data_dir":data_dir, "code_dir":code_dir, "freesurfer_home":freesurfer_home, "is_longitudinal":is_longitudinal, "host":host, "scratch_root":scratch_root, "freesurfer_cache":freesurfer_cache}
         if name == None:
             self.name = "FreeSurfer"
         else:
@@ -98,16 +236,30 @@ class Project(object):
         self.script_dir = code_dir + "/scripts/"
         self.submit_dir = code_dir + "/submit/"
         self.log_dir = code_dir + "/logs/"
+        self.registry_dir = code_dir + "/registry/"
+        self.cache_dir = code_dir + "/cache/"
+        self.lock_dir = code_dir + "/locks/"
         self.freesurfer_home = freesurfer_home
         self.is_longitudinal = is_longitudinal
         self.setup_dir = get_src()
         self.host = host
+        self.scratch_root = scratch_root
+        self.freesurfer_cache = freesurfer_cache
         if self.host == None:
             self.requires_host = False
             self.host = "$HOSTNAME"
         else:
             self.requires_host = True
         self.config_loc = self.script_dir+"config.sh"
+        self.env_loc = self.script_dir+"freesurfer_env.sh"
+        self.manifest_loc = self.script_dir+"freesurfer_manifest.md5"
+        self.state_loc = self.script_dir+"project.json"
+        self.registry_loc = self.registry_dir+"subjects.json"
+        self.dag_loc = self.submit_dir+"Extract_Sharded.dag"
+        self.shard_dir = self.submit_dir+"extract_shards/"
+        self.partial_dir = self.analysis_dir+"extracted/shards/"
+        self.queue_loc = self.registry_dir+"Cross_Initialize_queue.txt"
+        self.rerun_dag_loc = self.submit_dir+"Dependent_Reruns.dag"
         self.config = self.get_config()
 
         #Define Directories
@@ -116,43 +268,34 @@ class Project(object):
         self.script_dir,
         self.log_dir,
         self.submit_dir,
+        self.registry_dir,
+        self.cache_dir,
+        self.lock_dir,
         self.data_dir,
         self.subjects_dir,
         self.analysis_dir,
         self.analysis_dir + "/wholebrain/",
         self.analysis_dir + "/extracted/",
+        self.analysis_dir + "/cache/",
         ]
 
         #Define scripts
         self.scripts = [Script("View", flags=["config","subject","timepoint","timepoints","type","phase"]),
                         Script("Extract", flags=["config","subjectlist"]),
-                        Script("Cross_Initialize", flags=["config","subject","timepoint","inputfile"]),
-                        Script("Cross_Restart", flags=["config","subject","timepoint"]),
-                        Script("Cross_talRerun", flags=["config","subject","timepoint"]),
-                        Script("Cross_maskRerun", flags=["config","subject","timepoint"]),
-                        Script("Cross_cpRerun", flags=["config","subject","timepoint"]),
-                        Script("Cross_wmRerun", flags=["config","subject","timepoint"]),
-                        Script("Cross_gmRerun", flags=["config","subject","timepoint"])
+                        Script("Extract_Sharded", flags=["config","subjectlist","shardsize"]),
+                        Script("Cross_Initialize", flags=["config","subject","timepoint","inputfile"], recon=RECON_FLAGS["Initialize"])
                        ]
+        self.scripts.extend([Script("Cross_"+stage, flags=["config","subject","timepoint"], recon=RECON_FLAGS[stage]) for stage in RECON_STAGES[1:]])
+        # Map and reduce jobs submitted by Extract_Sharded's DAG; they have submit files but no column.
+        self.shard_scripts = [Script("Extract_Map", flags=["config","shard"]),
+                              Script("Extract_Reduce", flags=["config"])
+                             ]
         if self.is_longitudinal:
-            self.scripts.extend([Script("Base_Initialize", flags=["config","subject","timepoint"]),
-                                 Script("Base_Restart", flags=["config","subject","timepoint"]),
-                                 Script("Base_talRerun", flags=["config","subject","timepoint"]),
-                                 Script("Base_maskRerun", flags=["config","subject","timepoint"]),
-                                 Script("Base_cpRerun", flags=["config","subject","timepoint"]),
-                                 Script("Base_wmRerun", flags=["config","subject","timepoint"]),
-                                 Script("Base_gmRerun", flags=["config","subject","timepoint"]),
-                                 Script("Long_Initialize", flags=["config","subject","timepoint"]),
-                                 Script("Long_Restart", flags=["config","subject","timepoint"]),
-                                 Script("Long_talRerun", flags=["config","subject","timepoint"]),
-                                 Script("Long_maskRerun", flags=["config","subject","timepoint"]),
-                                 Script("Long_cpRerun", flags=["config","subject","timepoint"]),
-                                 Script("Long_wmRerun", flags=["config","subject","timepoint"]),
-                                 Script("Long_gmRerun", flags=["config","subject","timepoint"])
-                                ])
-
-
-    def get_config(self):
+            for phase in ["Base", "Long"]:
+                self.scripts.extend([Script(phase+"_"+stage, flags=["config","subject","timepoint"], recon=RECON_FLAGS[stage]) for stage in RECON_STAGES])
+
+
+    def get_config(self, freesurfer_version=""):
         #Define Config file
         config_dict = {
             "freesurfer_home":self.freesurfer_home,
@@ -161,13 +304,20 @@ class Project(object):
             "analysis_dir":self.analysis_dir,
             "monitor_dir":self.monitor_dir,
             "setup_dir":self.setup_dir,
+            "code_dir":self.code_dir,
             "log_dir":self.log_dir,
             "is_longitudinal":self.is_longitudinal,
             "host":self.host,
+            "scratch_root":self.scratch_root or "",
+            "env_loc":self.env_loc,
+            "freesurfer_cache":self.freesurfer_cache or "",
+            "freesurfer_version":freesurfer_version,
+            "manifest_loc":self.manifest_loc,
         }
         config = """#!/bin/bash
 
 export SETUP_DIR={setup_dir}
+export CODE_DIR={code_dir}
 export SUBMIT_DIR={submit_dir}
 export FREESURER_HOME={freesurfer_home}
 export SUBJECTS_DIR={subjects_dir}
@@ -175,9 +325,44 @@ export ANALYSIS_DIR={analysis_dir}
 export MONITOR_DIR={monitor_dir}
 export LOGS_DIR={log_dir}
 export IS_LONGITUDINAL={is_longitudinal}
-export DESIRED_HOSTNAME={host}""".format(**config_dict)
+export DESIRED_HOSTNAME={host}
+export SCRATCH_ROOT={scratch_root}
+export FREESURFER_ENV={env_loc}
+export FREESURFER_CACHE_ROOT={freesurfer_cache}
+export FREESURFER_VERSION={freesurfer_version}
+export FREESURFER_MANIFEST={manifest_loc}""".format(**config_dict)
         return config
 
+    def capture_environment(self):
+        """
+        Source SetUpFreeSurfer.sh once and record the variables it sets, so jobs can load a flat file instead.
+        Paths under FREESURFER_HOME are written relative to ${FREESURFER_HOME}, and variables it prepended to
+        (e.g. PATH) keep the job's own value after the prepended part. Returns None if FreeSurfer could not be sourced.
+        """
+        setup_loc = self.freesurfer_home+"/SetUpFreeSurfer.sh"
+        if not exists(setup_loc):
+            return None
+        # Sourced in a clean environment, so variables the calling shell already got from FreeSurfer are captured too.
+        environment = {"HOME":os.environ.get("HOME", "/"), "PATH":"/usr/bin:/bin", "FREESURFER_HOME":self.freesurfer_home}
+        command = ["bash", "-c", "env -0; echo -n ===; source {0} > /dev/null 2>&1; env -0".format(setup_loc)]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, env=environment)
+        output = process.communicate()[0].decode("utf-8", "replace")
+        if process.returncode != 0 or "===" not in output:
+            return None
+        before, after = [dict(line.split("=", 1) for line in part.split("\0") if "=" in line) for part in output.split("===", 1)]
+        lines = ["#!/bin/bash", "# FreeSurfer environment captured by setupfreesurfer from {0}".format(setup_loc), ""]
+        for name in sorted(after):
+            value = after[name]
+            if name in ["PWD", "OLDPWD", "SHLVL", "_", "FREESURFER_HOME", "SUBJECTS_DIR"] or before.get(name) == value:
+                continue
+            if before.get(name) and value.endswith(":" + before[name]):
+                escaped = shell_escape(value[:-len(before[name])]) + "${{{0}}}".format(name)
+            else:
+                escaped = shell_escape(value)
+            escaped = escaped.replace(self.freesurfer_home, "${FREESURFER_HOME}")
+            lines.append('export {0}="{1}"'.format(name, escaped))
+        return "\n".join(lines) + "\n"
+
     def render_script(self, script):
         submit_arg_string = "LOGS_DIR=${LOGS_DIR} SUBJECTS_DIR=${SUBJECTS_DIR} SETUP_DIR=${SETUP_DIR}"
         if "subject" in script.flags:
@@ -188,7 +373,7 @@ export DESIRED_HOSTNAME={host}""".format(**config_dict)
         else:
             submit_arg_string += " TARGET=Project"
 
-        script_render = """#!/bin/sh
+        script_render = """#!/bin/bash
 
 accepted_arguments="$@"
 
@@ -204,6 +389,7 @@ export MONITOR_DIR=$MONITOR_DIR
 export LOGS_DIR=$LOGS_DIR
 export IS_LONGITUDINAL=$IS_LONGITUDINAL
 export DESIRED_HOSTNAME=$DESIRED_HOSTNAME
+export SCRATCH_ROOT=$SCRATCH_ROOT
 
 while [[ "$#" > 1 ]]; do case $1 in\n""".format(config_log=self.config_loc)
         for flag in script.flags:
@@ -211,6 +397,8 @@ while [[ "$#" > 1 ]]; do case $1 in\n""".format(config_log=self.config_loc)
                 script_render += '    --{0}) {0}=$2;;\n'.format(flag)
             elif flag == "timepoint" and self.is_longitudinal and "Base" not in script.name:
                 script_render += '    --{0}) {0}=$2;;\n'.format(flag)
+            elif flag in ["subjectlist", "shardsize"] and script.name == "Extract_Sharded":
+                script_render += '    --{0}) {0}=$2;;\n'.format(flag)
         script_render += """    *);;
 esac; shift
 done
@@ -219,30 +407,58 @@ done
             script_render += """
 exec ${{SETUP_DIR}}/executables/{step_name}.sh $accepted_arguments
         """.format(step_name=script.name)
+        elif script.name == "Extract_Sharded":
+            script_render += """
+${{SETUP_DIR}}/setupfreesurfer.py shard --code_dir ${{CODE_DIR}} ${{subjectlist:+--subjectlist ${{subjectlist}}}} ${{shardsize:+--shardsize ${{shardsize}}}} && condor_submit_dag -force {dag}
+        """.format(dag=self.dag_loc)
+        elif script.recon != None:
+            # Submitted through the project's job index, which refuses or coalesces duplicate jobs on a subject.
+            script_render += """
+exec ${{SETUP_DIR}}/setupfreesurfer.py submit --code_dir ${{CODE_DIR}} {step_name} --subject "${{subject}}" ${{timepoint:+--timepoint ${{timepoint}}}} -- condor_submit ${{SUBMIT_DIR}}/cs_{step_name}.txt {arg_string} ${{REQUEST_MEMORY:+REQUEST_MEMORY=${{REQUEST_MEMORY}}}} args="$accepted_arguments"
+        """.format(step_name=script.name, arg_string=submit_arg_string)
         else:
             script_render += """
 condor_submit ${{SUBMIT_DIR}}/cs_{step_name}.txt {arg_string} args="$accepted_arguments"
         """.format(step_name=script.name, arg_string=submit_arg_string)
         return script_render
 
-    def render_submit(self, script):
-        if script.name == "Extract":
+    def render_submit(self, script, queue_from=None):
+        if script.name.startswith("Extract"):
             target = "project"
         else:
             target = "subject"
+        memory = script.memory
+        if script.recon != None:
+            executable, arguments = "$(SETUP_DIR)/fsjob.py", script.name+" $(args)"
+            # Retries after running out of memory pass a larger REQUEST_MEMORY.
+            memory = "$(REQUEST_MEMORY:{0})".format(script.memory)
+        else:
+            executable, arguments = "$(SETUP_DIR)/executables/{0}.sh".format(script.name), "$(args)"
 
         script_render = """Universe=vanilla
 getenv=True
 request_memory={memory}
 initialdir=$(SUBJECTS_DIR)
-Executable=$(SETUP_DIR)/executables/{step_name}.sh
+Executable={executable}
 Log=$(LOGS_DIR)/{step_name}_$(TARGET)_log.txt
 Output=$(LOGS_DIR)/{step_name}_$(TARGET)_out.txt
 Error=$(LOGS_DIR)/{step_name}_$(TARGET)_err.txt
-arguments=$(args)
-Queue""".format(memory=script.memory, step_name=script.name, target=target)
+arguments={arguments}{checkpoint}
+Queue""".format(checkpoint="\ncheckpoint_exit_code={0}".format(resume.CHECKPOINT_EXIT_CODE) if script.recon != None else "", memory=memory, step_name=script.name, target=target, executable=executable, arguments=arguments)
+        if queue_from != None:
+            script_render += " TARGET, args from {0}".format(queue_from)
         return script_render
 
+    def render_batch_script(self, script):
+        return """#!/bin/bash
+
+export CONFIG_FILE={config_log}
+source $CONFIG_FILE
+
+# Queues only the registered sessions not already queued or running, claiming each in the project's job index.
+exec ${{SETUP_DIR}}/setupfreesurfer.py batch --code_dir ${{CODE_DIR}} -- condor_submit ${{SUBMIT_DIR}}/cs_{step_name}_batch.txt LOGS_DIR=${{LOGS_DIR}} SUBJECTS_DIR=${{SUBJECTS_DIR}} SETUP_DIR=${{SETUP_DIR}}
+""".format(config_log=self.config_loc, step_name=script.name)
+
 
     def create_directories(self):
         for directory in self.dirs:
@@ -251,21 +467,189 @@ Queue""".format(memory=script.memory, step_name=script.name, target=target)
             except:
                 pass
 
+    def write_shard_dag(self, fs_ids, shard_size):
+        """
+        Split fs_ids into shard lists and write the Extract_Sharded DAG: one Extract_Map job per shard,
+        and an Extract_Reduce FINAL node that merges the partial tables (and reports failed shards).
+        Returns the number of shards.
+        """
+        for directory in [self.shard_dir, self.partial_dir]:
+            if exists(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+        node_vars = 'LOGS_DIR="{0}" SUBJECTS_DIR="{1}" SETUP_DIR="{2}"'.format(self.log_dir, self.subjects_dir, self.setup_dir)
+        dag = []
+        shards = [fs_ids[start:start+shard_size] for start in range(0, len(fs_ids), shard_size)]
+        for index, shard in enumerate(shards):
+            name = "shard{0:03d}".format(index)
+            write_file(self.shard_dir+name+".txt", "\n".join(shard)+"\n")
+            dag.append("JOB {0} {1}cs_Extract_Map.txt".format(name, self.submit_dir))
+            dag.append('VARS {0} TARGET="{0}" args="--config {1} --shard {2}{0}.txt" {3}'.format(name, self.config_loc, self.shard_dir, node_vars))
+        dag.append("FINAL reduce {0}cs_Extract_Reduce.txt".format(self.submit_dir))
+        dag.append('VARS reduce TARGET="Project" args="--config {0}" {1}'.format(self.config_loc, node_vars))
+        write_file(self.dag_loc, "\n".join(dag)+"\n")
+        return len(shards)
+
+    def write_rerun_dag(self, jobs):
+        """
+        Write the DAG of dependent reruns. jobs is a list of (fs_id, stage, arguments, parent fs_id or None);
+        a job with a parent waits for it to finish.
+        """
+        node_vars = 'LOGS_DIR="{0}" SUBJECTS_DIR="{1}" SETUP_DIR="{2}"'.format(self.log_dir, self.subjects_dir, self.setup_dir)
+        nodes = dict((job[0], "rerun{0:04d}".format(index)) for index, job in enumerate(jobs))
+        dag = []
+        for fs_id, stage, arguments, parent in jobs:
+            dag.append("JOB {0} {1}cs_{2}.txt".format(nodes[fs_id], self.submit_dir, stage))
+            dag.append('VARS {0} TARGET="{1}" args="{2}" {3}'.format(nodes[fs_id], fs_id, arguments, node_vars))
+        for fs_id, stage, arguments, parent in jobs:
+            if parent != None:
+                dag.append("PARENT {0} CHILD {1}".format(nodes[parent], nodes[fs_id]))
+        write_file(self.rerun_dag_loc, "\n".join(dag)+"\n")
+
+    @classmethod
+    def load(cls, code_dir):
+        """Recreate a project from the settings recorded by a previous setup."""
+        state_loc = clean_path(code_dir) + "/scripts/project.json"
+        if not exists(state_loc):
+            raise IOError("No project found in '{0}'. Run setup first.".format(clean_path(code_dir)))
+        return cls(**json.loads(load_file(state_loc))["settings"])
+
+    def row_id(self, subject, timepoint=None):
+        if self.is_longitudinal:
+            return "{0}_{1}".format(subject, timepoint)
+        return subject
+
+    def load_registry(self):
+        if exists(self.registry_loc):
+            return json.loads(load_file(self.registry_loc))
+        return {}
+
+    def register_subjects(self, entries):
+        """
+        Add rows for every (subject, timepoint, inputs) entry with a single structure update,
+        and set their initial cells. Cross_Initialize_batch queues them. Returns the list of newly added row ids.
+        """
+        registry = self.load_registry()
+        for subject, timepoint, inputs in entries:
+            row = self.row_id(subject, timepoint)
+            record = registry.setdefault(row, {"subject":subject, "timepoint":timepoint, "inputs":[]})
+            record["inputs"].extend([path for path in inputs if path not in record["inputs"]])
+        write_file(self.registry_loc, json.dumps(registry, sort_keys=True, indent=4))
+
+        structure = palantir.read_json(self.monitor_dir+"data/structure.json")
+        existing = [row["id"] for row in structure["rows"]]
+        new_rows = [row for row in sorted(registry) if row not in existing]
+        if new_rows:
+            palantir.update(self.monitor_dir, add_rows=new_rows)
+        for row in new_rows:
+            palantir.cell(self.monitor_dir, row_id=row, column_id="Extract", text="N/A", background_color="#d2d2d2", text_color="#f0f0f0", boolean="False")
+            palantir.cell(self.monitor_dir, row_id=row, column_id="Cross_Initialize", text="Registered", add_note="Registered from manifest")
+
+        return new_rows
+
+    def queue_entries(self):
+        """(row, Cross_Initialize arguments) of every registered session without a subject directory yet."""
+        registry = self.load_registry()
+        entries = []
+        for row in sorted(registry):
+            if exists(self.subjects_dir+row):
+                continue
+            record = registry[row]
+            args = "--config {0} --subject {1}".format(self.config_loc, record["subject"])
+            if self.is_longitudinal:
+                args += " --timepoint {0}".format(record["timepoint"])
+            args += "".join(" --inputfile {0}".format(path) for path in record["inputs"])
+            entries.append((row, args))
+        return entries
+
+    def write_queue(self, entries):
+        """Write the queue Cross_Initialize_batch submits from: a 'TARGET args' line per entry."""
+        write_file(self.queue_loc, "".join("{0} {1}\n".format(row, args) for row, args in entries))
+
+    def stages(self):
+        """The stage table of fsjob: every script that runs recon-all, by name."""
+        return dict((script.name, script) for script in self.scripts if script.recon != None)
+
+    def status_columns(self):
+        phases = ["cross", "base", "long"] if self.is_longitudinal else ["cross"]
+        return [dashboard.status_column(phase, self.is_longitudinal) for phase in phases]
+
+    def columns(self):
+        return [script.name for script in self.scripts] + self.status_columns() + ["QC", "Euler"]
+
+    def load_state(self):
+        """
+        The state file records what setup generated last time (files and dashboard columns),
+        so a rerun only has to touch what changed.
+        """
+        if exists(self.state_loc):
+            return json.loads(load_file(self.state_loc))
+        return {}
+
+    def save_state(self, state):
+        write_file(self.state_loc, json.dumps(state, sort_keys=True, indent=4))
+
     def write_scripts(self):
-        write_file(self.script_dir+"config.sh", self.get_config(), is_executable=True)
+        if self.freesurfer_cache != None:
+            manifest = fscache.manifest(self.freesurfer_home, self.cache_dir+"freesurfer_md5.json")
+            desired = {self.config_loc: (self.get_config(fscache.version(self.freesurfer_home, manifest)), True),
+                       self.manifest_loc: (manifest, False)}
+        else:
+            desired = {self.config_loc: (self.get_config(), True)}
+        environment = self.capture_environment()
+        if environment != None:
+            desired[self.env_loc] = (environment, False)
         for script in self.scripts:
-            write_file(self.script_dir+script.name+".sh", self.render_script(script), is_executable=True)
-            if script.name != "View":
-                write_file(self.submit_dir+"cs_"+script.name+".txt", self.render_submit(script))
+            desired[self.script_dir+script.name+".sh"] = (self.render_script(script), True)
+            if script.name not in ["View", "Extract_Sharded"]:
+                desired[self.submit_dir+"cs_"+script.name+".txt"] = (self.render_submit(script), False)
+            if script.name == "Cross_Initialize":
+                desired[self.script_dir+script.name+"_batch.sh"] = (self.render_batch_script(script), True)
+                desired[self.submit_dir+"cs_"+script.name+"_batch.txt"] = (self.render_submit(script, queue_from=self.queue_loc), False)
+
+        for script in self.shard_scripts:
+            desired[self.submit_dir+"cs_"+script.name+".txt"] = (self.render_submit(script), False)
+
+        state = self.load_state()
+        written = [path for path in sorted(desired) if write_file(path, desired[path][0], is_executable=desired[path][1])]
+        removed = []
+        for path in state.get("files", []):
+            if path not in desired and exists(path):
+                os.unlink(path)
+                removed.append(path)
+        state["files"] = sorted(desired)
+        state["settings"] = self.settings
+        self.save_state(state)
+        print("Scripts: {0} written, {1} removed, {2} unchanged.".format(len(written), len(removed), len(desired)-len(written)))
+        return written, removed
 
     def create_monitor(self):
-        if exists(self.monitor_dir):
-            shutil.rmtree(self.monitor_dir)
-        palantir.create(self.monitor_dir, self.name)
-        palantir.update(self.monitor_dir, add_rows=["Project"], add_columns=[script.name for script in self.scripts])
+        structure_loc = self.monitor_dir+"data/structure.json"
+        if exists(structure_loc):
+            structure = palantir.read_json(structure_loc)
+        else:
+            if exists(self.monitor_dir):
+                shutil.rmtree(self.monitor_dir)
+            palantir.create(self.monitor_dir, self.name)
+            structure = {"rows": [], "cols": []}
+
+        state = self.load_state()
+        existing = [column["id"] for column in structure["cols"]]
+        # Only columns setup added itself are candidates for removal; hand-added columns are kept.
+        managed = state.get("columns", LEGACY_COLUMNS)
+        desired = self.columns()
+        add_columns = [column for column in desired if column not in existing]
+        remove_columns = [column for column in managed if column not in desired and column in existing]
+        add_rows = [] if "Project" in [row["id"] for row in structure["rows"]] else ["Project"]
+
+        if add_columns or remove_columns or add_rows:
+            palantir.update(self.monitor_dir, add_rows=add_rows, add_columns=add_columns, remove_columns=remove_columns)
         for script in self.scripts:
-            if script.name != "Extract":
+            if not script.name.startswith("Extract") and (script.name in add_columns or add_rows):
                 palantir.cell(self.monitor_dir, row_id="Project", column_id=script.name, text="N/A", background_color="#d2d2d2", text_color="#f0f0f0", boolean="False")
+        state["columns"] = desired
+        self.save_state(state)
+        print("Monitor: {0} columns added, {1} removed.".format(len(add_columns), len(remove_columns)))
 
 
 class Script(object):
@@ -273,10 +657,13 @@ class Script(object):
     Script class.
 
     """
-    def __init__(self, name, flags, memory=3072):
+    def __init__(self, name, flags, memory=3072, recon=None, retries=3):
         self.name = idify(name)
         self.flags = flags
         self.memory = memory
+        self.recon = recon
+        # Resubmissions after out-of-memory or transient failures (recon stages).
+        self.retries = retries
 
 
 def run(args):
@@ -305,22 +692,451 @@ def run(args):
   else:
       args["--longitudinal"] = False
 
+  if args["--scratch"] in ["None", None]:
+      args["--scratch"] = None
+  elif not args["--scratch"].startswith("$"):
+      args["--scratch"] = clean_path(args["--scratch"])
+
+  if args["--local_freesurfer"] in ["None", None]:
+      args["--local_freesurfer"] = None
+  else:
+      args["--local_freesurfer"] = clean_path(args["--local_freesurfer"])
+
   if args["--name"] in ["None", None]:
       args["--name"] = None
   else:
       args["--name"] = str(args["--name"])
 
   # Setup
-  project = Project(name=args["--name"], data_dir=clean_path(args["--data_dir"]), code_dir=clean_path(args["--code_dir"]), freesurfer_home=clean_path(args["--freesurfer_home"]), is_longitudinal=args["--longitudinal"], host=args["--host"])
+  project = Project(name=args["--name"], data_dir=clean_path(args["--data_dir"]), code_dir=clean_path(args["--code_dir"]), freesurfer_home=clean_path(args["--freesurfer_home"]), is_longitudinal=args["--longitudinal"], host=args["--host"], scratch_root=args["--scratch"], freesurfer_cache=args["--local_freesurfer"])
   project.create_directories()
   project.write_scripts()
   project.create_monitor()
   print("Setup Complete!")
 
+def read_manifest(path, is_longitudinal):
+  entries = {}
+  with open(clean_path(path), "r") as manifest_file:
+      for line, record in enumerate(csv.DictReader(manifest_file), start=2):
+          subject = idify(record.get("subject") or "")
+          timepoint = idify(record.get("timepoint") or "")
+          if subject == "" or (is_longitudinal and timepoint == ""):
+              print("Manifest line {0}: a subject{1} is required.".format(line, " and timepoint" if is_longitudinal else ""))
+              sys.exit(1)
+          inputs = entries.setdefault((subject, timepoint or None), [])
+          if record.get("input"):
+              inputs.append(clean_path(record["input"]))
+  return [(subject, timepoint, inputs) for (subject, timepoint), inputs in sorted(entries.items())]
+
+def register(args):
+  project = Project.load(args["--code_dir"])
+  entries = read_manifest(args["<manifest>"], project.is_longitudinal)
+  added = project.register_subjects(entries)
+  print("Registered {0} sessions ({1} new rows).".format(len(entries), len(added)))
+
+def status(args):
+  project = Project.load(args["--code_dir"])
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=int(args["--workers"]))
+  for fs_id in sorted(statuses):
+      print("{0}\t{1}".format(statuses[fs_id], fs_id))
+  counts = {}
+  for value in statuses.values():
+      counts[value] = counts.get(value, 0) + 1
+  print(", ".join("{0}: {1}".format(key, counts[key]) for key in sorted(counts)))
+  if args["--sync"]:
+      stale = provenance.stale(project.subjects_dir, statuses, workers=int(args["--workers"]))
+      print("Updated {0} dashboard cells.".format(scan.sync(project.monitor_dir, provenance.mark(statuses, stale), project.is_longitudinal, texts=provenance.texts(stale))))
+
+def monitor(args):
+  project = Project.load(args["--code_dir"])
+  while True:
+      running, updated = progress.cycle(project, workers=int(args["--workers"]))
+      print("{0} {1} running, {2} cells updated.".format(time.strftime("%Y-%m-%d %H:%M:%S"), running, updated))
+      retry_failures(project)
+      if args["--once"]:
+          break
+      time.sleep(float(args["--interval"]))
+
+def runtime_summary(args):
+  project = Project.load(args["--code_dir"])
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=int(args["--workers"]))
+  connection = runtimes.connect(project.cache_dir+"runtimes.db")
+  try:
+      runtimes.update(connection, project.subjects_dir, statuses, statuses.keys(), workers=int(args["--workers"]))
+      step_medians = runtimes.medians(connection)
+  finally:
+      connection.close()
+  totals = runtimes.stage_hours(step_medians)
+  for stage in sorted(totals):
+      print("{0}\t{1}".format(stage, runtimes.hours(totals[stage])))
+  print("Median full run: {0} over {1} timed steps.".format(runtimes.hours(sum(step_medians.values())), len(step_medians)))
+
+def extract_ids(project, subjectlist, workers):
+  if subjectlist not in [None, "None"]:
+      return extract.read_subject_list(clean_path(subjectlist))
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+  return sorted(fs_id for fs_id in statuses if statuses[fs_id] == "Finished" and dashboard.phase_of(fs_id) == "cross")
+
+def report_extract(records):
+  incomplete = [record for record in records if record["missing"]]
+  for record in incomplete:
+      print("{0}: missing {1}".format(record["id"], ", ".join(os.path.basename(path) for path in record["missing"])))
+  print("Extracted {0} subjects ({1} parsed, {2} with missing stats files).".format(len(records), len([record for record in records if record.get("reparsed")]), len(incomplete)))
+  return incomplete
+
+def store_stats(project, records):
+  """Bring ANALYSIS_DIR/stats.db up to date with the extracted records; only changed subjects are rewritten."""
+  sessions = dict((row, (record["subject"], record["timepoint"])) for row, record in project.load_registry().items())
+  connection = statsdb.connect(project.analysis_dir+"stats.db")
+  try:
+      written = statsdb.update(connection, records, sessions=sessions)
+  finally:
+      connection.close()
+  print("Stats database: {0} subjects updated.".format(written))
+
+def long_sessions(project, subjectlist, workers):
+  """
+  (subject, timepoint) pairs for longitudinal extraction: every finished .long. directory (of a registered
+  session, if there is a registry), optionally limited to the subject ids in subjectlist.
+  """
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+  sessions = set(extract.split_long_id(fs_id) for fs_id in statuses if statuses[fs_id] == "Finished" and dashboard.phase_of(fs_id) == "long")
+  registry = project.load_registry()
+  if registry:
+      sessions &= set((record["subject"], record["timepoint"]) for record in registry.values())
+  if subjectlist not in [None, "None"]:
+      subjects = set(extract.read_subject_list(clean_path(subjectlist)))
+      sessions = set(session for session in sessions if session[0] in subjects)
+  return sorted(sessions)
+
+def run_extract(args):
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  cache_dir = project.analysis_dir+"cache/"
+  if args["--longitudinal"] in [True, "True", "true"]:
+      sessions = long_sessions(project, args["--subjectlist"], workers)
+      records = extract.extract_longitudinal(project.subjects_dir, project.analysis_dir+"extracted/long/", sessions, workers=workers, cache_dir=cache_dir, use_hash=args["--hash"])
+      store_stats(project, records)
+      if report_extract(records):
+          sys.exit(1)
+      return
+  fs_ids = extract_ids(project, args["--subjectlist"], workers)
+  if args["--partial"] not in [None, "None"]:
+      records = extract.parse(project.subjects_dir, fs_ids, workers=workers, cache_dir=cache_dir, use_hash=args["--hash"])
+      extract.write_partial(records, clean_path(args["--partial"]))
+  else:
+      records = extract.extract(project.subjects_dir, project.analysis_dir+"extracted/", fs_ids, workers=workers, cache_dir=cache_dir, use_hash=args["--hash"])
+      store_stats(project, records)
+  if report_extract(records):
+      sys.exit(1)
+
+def shard(args):
+  project = Project.load(args["--code_dir"])
+  fs_ids = extract_ids(project, args["--subjectlist"], int(args["--workers"]))
+  shards = project.write_shard_dag(fs_ids, int(args["--shardsize"]))
+  palantir.cell(project.monitor_dir, row_id="Project", column_id="Extract_Sharded", text="Queued: {0} shards".format(shards), add_note="Submitted {0} subjects in {1} shards".format(len(fs_ids), shards))
+  print("Wrote {0} with {1} shards.".format(project.dag_loc, shards))
+
+def merge(args):
+  project = Project.load(args["--code_dir"])
+  partials = [project.partial_dir+name[:-len(".txt")]+".json" for name in sorted(os.listdir(project.shard_dir)) if name.endswith(".txt")]
+  records, missing = extract.merge(partials, project.analysis_dir+"extracted/")
+  store_stats(project, records)
+  for path in missing:
+      print("Missing partial table: {0}".format(path))
+  if report_extract(records) or missing:
+      sys.exit(1)
+
+def roi_volumes(args):
+  if volumes.numpy == None:
+      print("volumes requires numpy, which is not installed.")
+      sys.exit(1)
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  fs_ids = extract_ids(project, args["--subjectlist"], workers)
+  lut_loc = clean_path(args["--lut"]) if args["--lut"] not in [None, "None"] else project.freesurfer_home+"/FreeSurferColorLUT.txt"
+  lut = volumes.read_lut(lut_loc)
+  missing = 0
+  for segmentation in args["--segmentation"] or ["aseg", "aparc+aseg"]:
+      records = volumes.label_volumes(project.subjects_dir, fs_ids, segmentation, lut, workers=workers)
+      for measure in ["nvoxels", "volume"]:
+          table = volumes.table_name(segmentation, measure)
+          extract.write_table(project.analysis_dir+"extracted/"+table+"-table.csv", table, records, header="Measure:"+measure)
+      name = volumes.table_name(segmentation)
+      missing += len([record for record in records if record["missing"]])
+      print("{0}: {1} subjects, {2} missing.".format(name, len(records), len([record for record in records if record["missing"]])))
+  if missing:
+      sys.exit(1)
+
+def wholebrain(args):
+  if overlays.numpy == None:
+      print("wholebrain requires numpy, which is not installed.")
+      sys.exit(1)
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  fs_ids = extract_ids(project, args["--subjectlist"], workers)
+  failed = 0
+  for hemi in args["--hemi"] or ["lh", "rh"]:
+      name, added, missing = overlays.append(project.subjects_dir, project.analysis_dir+"wholebrain/", args["--overlay"], hemi, fs_ids, workers=workers)
+      for fs_id in missing:
+          print("Missing or mismatched overlay: {0} ({1})".format(fs_id, name))
+      failed += len(missing)
+      print("{0}: {1} subjects added, {2} missing.".format(name, len(added), len(missing)))
+  if failed:
+      sys.exit(1)
+
+def run_qc(args):
+  if qc.numpy == None:
+      print("qc requires numpy, which is not installed.")
+      sys.exit(1)
+  project = Project.load(args["--code_dir"])
+  matrix_dir = project.analysis_dir+"extracted/"+columnar.MATRIX_DIR
+  if not exists(matrix_dir+"/subjects.npy"):
+      print("{0} does not exist yet; run extract first.".format(matrix_dir))
+      sys.exit(1)
+  subjects, labels, values = qc.load_matrix(matrix_dir)
+  results = qc.outliers(subjects, labels, values, threshold=float(args["--threshold"]))
+  qc.write_report(project.analysis_dir+"extracted/qc-outliers.csv", results)
+  updated = dashboard.push(project.monitor_dir, qc.updates(results, set(dashboard.rows(project.monitor_dir))))
+  print("QC: {0} of {1} subjects have outliers, {2} cells updated.".format(len([result for result in results if result[1]]), len(results), updated))
+
+def harvest_defects(args):
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+  fs_ids = [fs_id for fs_id in statuses if statuses[fs_id] != "Not Started" and dashboard.phase_of(fs_id) == "cross"]
+  states = defects.update(project.subjects_dir, fs_ids, project.cache_dir+"defects.json", workers=workers)
+  defects.write_table(project.analysis_dir+"extracted/euler-table.csv", states)
+  updated = dashboard.push(project.monitor_dir, defects.updates(states, set(dashboard.rows(project.monitor_dir))))
+  print("Defects: {0} subjects with Euler numbers, {1} cells updated.".format(len([state for state in states.values() if defects.complete(state)]), updated))
+
+def stage_arguments(project, fs_id):
+  """Arguments of the generated stage scripts for a SUBJECTS_DIR entry: the config, its subject and its timepoints."""
+  arguments = ["--config", project.config_loc]
+  phase = dashboard.phase_of(fs_id)
+  if phase == "long":
+      subject, timepoint = extract.split_long_id(fs_id)
+      return arguments + ["--subject", subject, "--timepoint", timepoint]
+  if phase == "base":
+      subject = fs_id[:-len("_base")]
+      crosses = [row for row in dashboard.locate(fs_id, os.listdir(project.subjects_dir))[1] if dashboard.phase_of(row) == "cross"]
+      return arguments + ["--subject", subject] + [argument for cross in sorted(crosses) for argument in ["--timepoint", cross[len(subject)+1:]]]
+  if not project.is_longitudinal:
+      return arguments + ["--subject", fs_id]
+  record = project.load_registry().get(fs_id)
+  subject, timepoint = (record["subject"], record["timepoint"]) if record != None else fs_id.rsplit("_", 1)
+  return arguments + ["--subject", subject, "--timepoint", timepoint]
+
+def rerun(args):
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+  if args["<fs_id>"]:
+      fs_ids = args["<fs_id>"]
+  elif args["--subjectlist"] not in [None, "None"]:
+      fs_ids = extract.read_subject_list(clean_path(args["--subjectlist"]))
+  else:
+      fs_ids = sorted(statuses)
+  for fs_id in fs_ids:
+      if statuses.get(fs_id) not in ["Finished", "Error"]:
+          print("{0}: skipped ({1})".format(fs_id, statuses.get(fs_id, "not in SUBJECTS_DIR")))
+  plans = edits.plan_all(project.subjects_dir, [fs_id for fs_id in fs_ids if statuses.get(fs_id) in ["Finished", "Error"]], workers=workers)
+  submitted, failed = 0, 0
+  for fs_id in sorted(plans):
+      stage, files = plans[fs_id]
+      if stage == None:
+          continue
+      name = dashboard.phase_of(fs_id).capitalize()+"_"+stage
+      if name not in project.stages():
+          print("{0}: {1} is not a stage of this project".format(fs_id, name))
+          failed += 1
+          continue
+      print("{0}: {1} ({2} changed)".format(fs_id, name, ", ".join(files)))
+      if args["--dry_run"]:
+          continue
+      if subprocess.call([project.script_dir+name+".sh"] + stage_arguments(project, fs_id)) == 0:
+          submitted += 1
+      else:
+          failed += 1
+  print("Rerun: {0} of {1} subjects edited, {2} submitted.".format(len([plan for plan in plans.values() if plan[0] != None]), len(plans), submitted))
+  if failed:
+      sys.exit(1)
+
+def invalidate(args):
+  project = Project.load(args["--code_dir"])
+  workers = int(args["--workers"])
+  statuses = scan.scan(project.subjects_dir, cache_loc=project.cache_dir+"status.json", workers=workers)
+  stale = provenance.stale(project.subjects_dir, statuses, workers=workers)
+  updated = scan.sync(project.monitor_dir, provenance.mark({}, stale), project.is_longitudinal, texts=provenance.texts(stale))
+  jobs = []
+  for fs_id in sorted(stale, key=lambda fs_id: (dashboard.phase_of(fs_id) != "base", fs_id)):
+      parent = None
+      if dashboard.phase_of(fs_id) == "long":
+          base = fs_id.split(".long.", 1)[1]
+          if base in stale:
+              parent = base
+          elif statuses.get(base) != "Finished":
+              print("{0}: waiting for {1} ({2})".format(fs_id, base, statuses.get(base, "not in SUBJECTS_DIR")))
+              continue
+      stage = dashboard.phase_of(fs_id).capitalize()+"_Initialize"
+      print("{0}: {1} ({2}){3}".format(fs_id, stage, provenance.texts(stale)[fs_id], "" if parent == None else ", after "+parent))
+      jobs.append((fs_id, stage, " ".join(stage_arguments(project, fs_id)), parent))
+  print("Invalidate: {0} stale directories, {1} cells updated.".format(len(stale), updated))
+  if not jobs or args["--dry_run"]:
+      return
+  # A node already queued or running is left out, along with the longs waiting for it.
+  claimed = []
+  for fs_id, stage, arguments, parent in jobs:
+      if parent == None or parent in dict(claimed):
+          claimed.extend(claim_jobs(project, [(fs_id, stage)]))
+      else:
+          print("{0}: waiting for {1}; {2} not submitted.".format(fs_id, parent, stage))
+  jobs = [(fs_id, stage, arguments, parent) for fs_id, stage, arguments, parent in jobs if (fs_id, stage) in claimed]
+  if not jobs:
+      return
+  project.write_rerun_dag(jobs)
+  sys.exit(submit_claimed(project, claimed, ["condor_submit_dag", "-force", project.rerun_dag_loc]))
+
+def submit(args):
+  project = Project.load(args["--code_dir"])
+  stage = args["<stage>"]
+  if stage not in project.stages():
+      print("Unknown stage '{0}'.".format(stage))
+      sys.exit(1)
+  target = job.describe(project.stages()[stage], args["--subject"], [args["--timepoint"]], [], project.is_longitudinal)[0]
+  claimed, entry = locks.claim(project.lock_dir, target, stage)
+  if not claimed:
+      cluster = " (cluster {0})".format(entry["cluster"]) if entry.get("cluster") != None else ""
+      if entry.get("stage") == stage:
+          print("{0}: {1} is already queued or running{2}; not submitted again.".format(target, stage, cluster))
+          return
+      print("{0}: {1} is queued or running{2}; refusing to submit {3}.".format(target, entry.get("stage"), cluster, stage))
+      sys.exit(1)
+  returncode = submit_claimed(project, [(target, stage)], args["<command>"])
+  if returncode != 0:
+      sys.exit(returncode)
+
+def claim_jobs(project, jobs):
+  """Claim each (target, stage) in the job index. Returns the claimed ones; the others are already queued or running."""
+  claimed = []
+  for target, stage in jobs:
+      success, entry = locks.claim(project.lock_dir, target, stage)
+      if success:
+          claimed.append((target, stage))
+      else:
+          print("{0}: {1} is queued or running; {2} not submitted.".format(target, entry.get("stage"), stage))
+  return claimed
+
+def submit_claimed(project, claimed, command):
+  """
+  Run a condor_submit (or condor_submit_dag) command for the claimed (target, stage) jobs. Their claims are
+  released if it fails, and otherwise given the cluster it reports. Returns its exit code.
+  """
+  process = subprocess.Popen(command, stdout=subprocess.PIPE)
+  output = process.communicate()[0].decode("utf-8", "replace")
+  sys.stdout.write(output)
+  if process.returncode != 0:
+      for target, stage in claimed:
+          locks.release_job(project.lock_dir, target, stage)
+      return process.returncode
+  match = re.search(r"submitted to cluster (\d+)", output)
+  if match:
+      for target, stage in claimed:
+          locks.set_cluster(project.lock_dir, target, int(match.group(1)))
+  return 0
+
+def batch(args):
+  project = Project.load(args["--code_dir"])
+  entries = dict(project.queue_entries())
+  claimed = claim_jobs(project, [(row, "Cross_Initialize") for row in sorted(entries)])
+  project.write_queue([(row, entries[row]) for row, stage in claimed])
+  print("Batch: {0} of {1} registered sessions queued.".format(len(claimed), len(entries)))
+  if claimed:
+      sys.exit(submit_claimed(project, claimed, args["<command>"]))
+
+def retry_failures(project, dry_run=False):
+  """
+  Resubmit, through the stage scripts, every recorded failure that is to be retried and whose backoff
+  has passed. A subject recon-all already started on is resubmitted as its phase's Resume stage, so the
+  retry only runs what is left. Returns (resubmitted, needing review).
+  """
+  failure_dir = project.cache_dir+"failures/"
+  stages = project.stages()
+  resubmitted, review = [], []
+  for target, failure in sorted(failures.load(failure_dir).items()):
+      if not failure.get("retry") or failure["stage"] not in stages:
+          review.append(target)
+          continue
+      if not failures.due(failure):
+          continue
+      # Resume only once recon-all has imported the inputs; a cross run that failed before that starts over.
+      stage = failure["stage"].split("_")[0]+"_Resume"
+      started = resume.imported(project.subjects_dir+target) if dashboard.phase_of(target) == "cross" else exists(project.subjects_dir+target+"/scripts")
+      if stage not in stages or not started:
+          stage = failure["stage"]
+      memory = failures.next_memory(failure)
+      print("{0}: resubmitting {1} as {2} after a {3} failure ({4} of {5}), {6} MB".format(target, failure["stage"], stage, failure["kind"], failure["attempts"], stages[failure["stage"]].retries, memory))
+      if dry_run:
+          continue
+      environ = dict(os.environ, REQUEST_MEMORY=str(memory))
+      if subprocess.call([project.script_dir+stage+".sh"] + failure["arguments"], env=environ) == 0:
+          failures.mark_resubmitted(failure_dir, target, failure)
+          resubmitted.append(target)
+  return resubmitted, review
+
+def retry(args):
+  project = Project.load(args["--code_dir"])
+  resubmitted, review = retry_failures(project, dry_run=args["--dry_run"])
+  recorded = failures.load(project.cache_dir+"failures/")
+  for target in review:
+      failure = recorded[target]
+      print("{0}: {1} needs review after {2} attempt(s), {3}: {4}".format(target, failure["stage"], failure["attempts"], failure["kind"], failure["reason"]))
+  print("Retry: {0} resubmitted, {1} need review.".format(len(resubmitted), len(review)))
+
 #------------------------------------
 #    Main
 #------------------------------------
 
+def print_freesurfer_home(args):
+  project = Project.load(args["--code_dir"])
+  config = job.read_exports(project.config_loc, os.environ)
+  print(job.freesurfer_home(project, config))
+
 if __name__ == '__main__':
     args = docopt(doc, version='Setup FreeSurfer v{0}'.format(Version))
-    run(args)
+    if args["register"]:
+        register(args)
+    elif args["status"]:
+        status(args)
+    elif args["monitor"]:
+        monitor(args)
+    elif args["runtimes"]:
+        runtime_summary(args)
+    elif args["extract"]:
+        run_extract(args)
+    elif args["shard"]:
+        shard(args)
+    elif args["merge"]:
+        merge(args)
+    elif args["volumes"]:
+        roi_volumes(args)
+    elif args["wholebrain"]:
+        wholebrain(args)
+    elif args["qc"]:
+        run_qc(args)
+    elif args["defects"]:
+        harvest_defects(args)
+    elif args["rerun"]:
+        rerun(args)
+    elif args["invalidate"]:
+        invalidate(args)
+    elif args["submit"]:
+        submit(args)
+    elif args["retry"]:
+        retry(args)
+    elif args["batch"]:
+        batch(args)
+    elif args["freesurfer_home"]:
+        print_freesurfer_home(args)
+    else:
+        run(args)